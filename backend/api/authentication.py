@@ -0,0 +1,38 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def token_cache_key(key):
+    return f"auth:token:{sha256(key.encode()).hexdigest()}"
+
+
+def invalidate_tokens(keys):
+    keys = [token_cache_key(key) for key in keys]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related("user").get(key=key)
+            except model.DoesNotExist:
+                raise AuthenticationFailed(_("Invalid token."))
+            cache.set(cache_key, token, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+        if not token.user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+
+        return (token.user, token)
@@ -0,0 +1,182 @@
+from base64 import b64encode
+from collections import namedtuple
+from time import perf_counter
+from urllib.parse import quote, urlencode
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+Suite = namedtuple("Suite", ("cases", "max_queries", "authenticated"))
+
+SUITES = {}
+
+SEARCH_WORDS = ("картофель", "молоко", "соль", "сыр")
+RECIPE_SEARCH_WORDS = ("суп", "салат картофель", "пирог сыр", "молок")
+PAGE_DEPTHS = (1, 10, 100, 1000, 10000)
+PAGE_LIMIT = 6
+DETAIL_SAMPLES = 5
+RECIPES_LIMITS = (None, 3)
+COOKABLE_SIZES = (3, 10, 30)
+
+
+def register(name, max_queries=None, authenticated=False):
+    def decorator(func):
+        SUITES[name] = Suite(func, max_queries, authenticated)
+        return func
+
+    return decorator
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = round(percent / 100 * (len(ordered) - 1))
+    return ordered[index]
+
+
+def measure(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            timings.append((perf_counter() - start) * 1000)
+    return {
+        "status": response.status_code,
+        "queries": len(queries),
+        "p50": percentile(timings, 50),
+        "p95": percentile(timings, 95),
+        "max": max(timings),
+        "slowest": max(
+            queries.captured_queries,
+            key=lambda query: float(query["time"]),
+            default={"sql": ""},
+        )["sql"],
+    }
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+        return "\n".join(
+            " ".join(str(column) for column in row)
+            for row in cursor.fetchall()
+        )
+
+
+@register("ingredients", max_queries=1)
+def ingredient_search(user):
+    for word in SEARCH_WORDS:
+        for end in range(1, len(word) + 1):
+            prefix = word[:end]
+            yield f"name={prefix}", f"/api/ingredients/?name={quote(prefix)}"
+
+
+@register("pagination", max_queries=4)
+def deep_pages(user):
+    total = Recipe.objects.count()
+    for page in PAGE_DEPTHS:
+        offset = (page - 1) * PAGE_LIMIT
+        if offset >= total:
+            break
+        yield (
+            f"page={page}",
+            f"/api/recipes/?page={page}&limit={PAGE_LIMIT}",
+        )
+        if page == 1:
+            yield "cursor page 1", "/api/recipes/?pagination=cursor"
+            continue
+        position = Recipe.objects.values_list("pub_date", flat=True)[
+            offset - 1
+        ]
+        cursor = b64encode(urlencode({"p": str(position)}).encode()).decode()
+        yield (
+            f"cursor page {page}",
+            f"/api/recipes/?limit={PAGE_LIMIT}&cursor={quote(cursor)}",
+        )
+
+
+@register("filters", max_queries=4)
+def recipe_filters(user):
+    slugs = list(Tag.objects.values_list("slug", flat=True)[:3])
+    author = Recipe.objects.values_list("author", flat=True).first()
+    yield "all", "/api/recipes/"
+    for end in range(1, len(slugs) + 1):
+        tags = "&".join(f"tags={slug}" for slug in slugs[:end])
+        yield f"tags x{end}", f"/api/recipes/?{tags}"
+    yield "author", f"/api/recipes/?author={author}"
+    yield "is_favorited", "/api/recipes/?is_favorited=1"
+    yield "is_in_shopping_cart", "/api/recipes/?is_in_shopping_cart=1"
+    yield "not is_favorited", "/api/recipes/?is_favorited=0"
+    if slugs:
+        yield (
+            "tags + is_favorited",
+            f"/api/recipes/?tags={slugs[0]}&is_favorited=1",
+        )
+
+
+@register("search", max_queries=4)
+def recipe_search(user):
+    for word in RECIPE_SEARCH_WORDS:
+        yield f"search={word}", f"/api/recipes/?search={quote(word)}"
+    yield "search + tags", (
+        f"/api/recipes/?search={quote(RECIPE_SEARCH_WORDS[0])}"
+        f"&tags={Tag.objects.values_list('slug', flat=True).first()}"
+    )
+
+
+@register("cookable", max_queries=4)
+def cookable(user):
+    links = IngredientInRecipe.objects.order_by("recipe_id")
+    for size in COOKABLE_SIZES:
+        ids = links.values_list("ingredients_id", flat=True)[:size]
+        query = "&".join(f"ingredients={pk}" for pk in ids)
+        yield f"ingredients x{size}", f"/api/recipes/cookable/?{query}"
+
+
+@register("detail", max_queries=3)
+def recipe_detail(user):
+    recipes = Recipe.objects.order_by("-favorites_count")
+    for pk in recipes.values_list("pk", flat=True)[:DETAIL_SAMPLES]:
+        yield f"recipe {pk}", f"/api/recipes/{pk}/"
+
+
+@register("similar", max_queries=1)
+def similar_recipes(user):
+    recipes = Recipe.objects.order_by("-favorites_count")
+    for pk in recipes.values_list("pk", flat=True)[:DETAIL_SAMPLES]:
+        yield f"recipe {pk}", f"/api/recipes/{pk}/similar/"
+
+
+@register("subscriptions", max_queries=4, authenticated=True)
+def subscriptions(user):
+    for limit in RECIPES_LIMITS:
+        query = "" if limit is None else f"&recipes_limit={limit}"
+        yield (
+            f"recipes_limit={limit}",
+            f"/api/users/subscriptions/?page=1{query}",
+        )
+    # Новый пользователь ни на кого не подписан: страница авторов пуста.
+    loner = User.objects.exclude(
+        pk__in=User.follow.through.objects.values("from_user")
+    ).first()
+    if loner is not None:
+        for query in ("page=1", "pagination=cursor"):
+            yield (
+                f"no follows, {query}",
+                f"/api/users/subscriptions/?{query}&recipes_limit=3",
+                loner,
+            )
+
+
+@register("download", max_queries=2, authenticated=True)
+def download_shopping_cart(user):
+    for file_format in ("txt", "csv", "json"):
+        yield (
+            file_format,
+            f"/api/recipes/download_shopping_cart/?file_format={file_format}",
+        )
@@ -0,0 +1,105 @@
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+
+BASE64_MARKER = ";base64,"
+BASE64_CHUNK_SIZE = 64 * 1024
+
+IMAGE_FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif"}
+
+
+def iter_base64_chunks(data, start=0, chunk_size=BASE64_CHUNK_SIZE):
+    rest = ""
+    for offset in range(start, len(data), chunk_size):
+        chunk = rest + "".join(data[offset : offset + chunk_size].split())
+        usable = len(chunk) - len(chunk) % 4
+        rest = chunk[usable:]
+        if usable:
+            yield binascii.a2b_base64(chunk[:usable].encode("ascii"))
+    if rest:
+        raise binascii.Error("Incorrect padding")
+
+
+class RecipeImageField(Base64ImageField):
+    default_error_messages = {
+        "invalid_image": "Загрузите корректную картинку в формате base64",
+        "image_format": "Допустимые форматы картинки: jpeg, png, gif",
+        "image_too_large": "Картинка больше {max_size} байт",
+        "image_too_wide": "Картинка больше {max_side}x{max_side} пикселей",
+    }
+
+    def __init__(self, *args, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(data, str):
+            self.fail("invalid_image")
+
+        marker = data.find(BASE64_MARKER, 0, 100)
+        start = marker + len(BASE64_MARKER) if marker >= 0 else 0
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if (len(data) - start) // 4 * 3 > max_size + 2:
+            self.fail("image_too_large", max_size=max_size)
+
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+        )
+        try:
+            size = self.decode(data, start, file, max_size)
+            image_format = self.check_image(file)
+        except Exception:
+            file.close()
+            raise
+
+        file.seek(0)
+        extension = IMAGE_FORMATS[image_format]
+        return UploadedFile(
+            file,
+            name=f"{uuid.uuid4()}.{extension}",
+            content_type=Image.MIME[image_format],
+            size=size,
+        )
+
+    def decode(self, data, start, file, max_size):
+        size = 0
+        try:
+            for chunk in iter_base64_chunks(data, start):
+                size += len(chunk)
+                if size > max_size:
+                    self.fail("image_too_large", max_size=max_size)
+                file.write(chunk)
+        except (binascii.Error, UnicodeEncodeError):
+            self.fail("invalid_image")
+        return size
+
+    def check_image(self, file):
+        file.seek(0)
+        max_side = settings.RECIPE_IMAGE_MAX_SIDE
+        try:
+            with Image.open(file) as image:
+                if image.format not in IMAGE_FORMATS:
+                    self.fail("image_format")
+                if max(image.size) > max_side:
+                    self.fail("image_too_wide", max_side=max_side)
+                image.verify()
+                return image.format
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            self.fail("invalid_image")
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = value.instance.get_image_url(self.variant)
+        request = self.context.get("request")
+        if request is None:
+            return url
+        return request.build_absolute_uri(url)
@@ -1,15 +1,32 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
+from recipes.fulltext import search_recipes
 from recipes.models import Recipe
 
 
+class MultipleValueField(forms.Field):
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [item for item in value or () if item]
+
+
+class MultipleValueFilter(filters.Filter):
+    field_class = MultipleValueField
+
+
 class RecipeFilter(filters.FilterSet):
+    tags = MultipleValueFilter(method="filter_tags")
+    author = filters.NumberFilter(field_name="author_id")
     is_in_shopping_cart = filters.BooleanFilter(
         field_name="is_in_shopping_list", method="filter_is_in_shopping_cart"
     )
     is_favorited = filters.BooleanFilter(
         field_name="is_favorite", method="filter_is_favorited"
     )
+    search = filters.CharFilter(method="filter_search")
 
     class Meta:
         model = Recipe
@@ -18,16 +35,32 @@ class RecipeFilter(filters.FilterSet):
     def __init__(self, *args, **kwargs):
         self.request = kwargs["request"]
         super().__init__(*args, **kwargs)
-        
 
-    def filter_is_in_shopping_cart(self, queryset, name, value):
+    def filter_tags(self, queryset, name, value):
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef("pk"), tag__slug__in=value
+                )
+            )
+        )
+
+    def filter_by_user(self, queryset, through, value):
         user = self.request.user
-        if value:
-            return queryset.filter(is_in_shopping_list=user)
-        return queryset.exclude(is_in_shopping_list=user)
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+        related = Exists(
+            through.objects.filter(recipe=OuterRef("pk"), user=user)
+        )
+        return queryset.filter(related if value else ~related)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_by_user(
+            queryset, Recipe.is_in_shopping_list.through, value
+        )
 
     def filter_is_favorited(self, queryset, name, value):
-        user = self.request.user
-        if value:
-            return queryset.filter(is_favorite=user)
-        return queryset.exclude(is_favorite=user)
+        return self.filter_by_user(queryset, Recipe.is_favorite.through, value)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
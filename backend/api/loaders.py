@@ -0,0 +1,58 @@
+from recipes.models import Recipe
+from users.models import User
+
+RELATIONS = {
+    "favorites": (Recipe.is_favorite.through, "user", "recipe_id"),
+    "shopping_cart": (
+        Recipe.is_in_shopping_list.through,
+        "user",
+        "recipe_id",
+    ),
+    "follows": (User.follow.through, "from_user", "to_user_id"),
+}
+
+
+class UserRelations:
+    def __init__(self, user):
+        self.user = user
+        self._members = {name: set() for name in RELATIONS}
+        self._checked = {name: set() for name in RELATIONS}
+        self._complete = set()
+
+    def _fetch(self, name, ids=None):
+        model, owner, target = RELATIONS[name]
+        queryset = model.objects.filter(**{owner: self.user})
+        if ids is not None:
+            queryset = queryset.filter(**{f"{target}__in": ids})
+        return set(queryset.values_list(target, flat=True))
+
+    def preload(self, name, ids):
+        if self.user.is_anonymous or name in self._complete:
+            return
+        ids = set(ids) - self._checked[name]
+        if ids:
+            self._members[name] |= self._fetch(name, ids)
+            self._checked[name] |= ids
+
+    def contains(self, name, object_id):
+        if self.user.is_anonymous:
+            return False
+        if name not in self._complete and object_id not in self._checked[name]:
+            self._members[name] = self._fetch(name)
+            self._complete.add(name)
+        return object_id in self._members[name]
+
+    def is_favorited(self, recipe):
+        return self.contains("favorites", recipe.pk)
+
+    def is_in_shopping_cart(self, recipe):
+        return self.contains("shopping_cart", recipe.pk)
+
+    def is_subscribed(self, author):
+        return self.contains("follows", author.pk)
+
+
+def get_user_relations(context):
+    if "relations" not in context:
+        context["relations"] = UserRelations(context["request"].user)
+    return context["relations"]
@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+
+from api.benchmarks import SUITES, explain, measure
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Замер задержки и числа SQL-запросов горячих эндпоинтов API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "suites",
+            nargs="*",
+            help=f"Наборы замеров: {', '.join(sorted(SUITES))}",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Количество повторов каждого запроса",
+        )
+        parser.add_argument(
+            "--user",
+            help="Email пользователя, от имени которого выполнять запросы",
+        )
+        parser.add_argument(
+            "--max-p95",
+            type=float,
+            help="Порог p95 в миллисекундах для каждого запроса",
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="Вывести план самого медленного запроса каждого замера",
+        )
+
+    def handle(self, *args, **options):
+        suites = options["suites"] or sorted(SUITES)
+        unknown = set(suites) - set(SUITES)
+        if unknown:
+            raise CommandError(f"Неизвестные наборы: {', '.join(unknown)}")
+
+        client = APIClient()
+        user = None
+        if options["user"]:
+            try:
+                user = User.objects.get(email=options["user"])
+            except User.DoesNotExist:
+                raise CommandError(
+                    f"Пользователь {options['user']} не существует"
+                )
+
+        failures = []
+        for name in suites:
+            suite = SUITES[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if suite.authenticated and user is None:
+                self.stdout.write("  пропущен: нужен --user")
+                continue
+            for label, url, *as_user in suite.cases(user):
+                client.force_authenticate(as_user[0] if as_user else user)
+                result = measure(client, url, options["repeat"])
+                problems = self.find_problems(
+                    result, suite, options["max_p95"]
+                )
+                if problems:
+                    failures.append(f"{name} / {label}: {', '.join(problems)}")
+                self.stdout.write(
+                    f"{label:<32} {result['status']} "
+                    f"p50 {result['p50']:7.2f} ms  "
+                    f"p95 {result['p95']:7.2f} ms  "
+                    f"max {result['max']:7.2f} ms  "
+                    f"queries {result['queries']}"
+                )
+                if options["explain"] and result["slowest"]:
+                    self.stdout.write(explain(result["slowest"]))
+
+        if failures:
+            raise CommandError("Превышены пороги:\n" + "\n".join(failures))
+
+    def find_problems(self, result, suite, max_p95):
+        problems = []
+        if result["status"] >= 400:
+            problems.append(f"статус {result['status']}")
+        if suite.max_queries is not None and (
+            result["queries"] > suite.max_queries
+        ):
+            problems.append(
+                f"запросов {result['queries']} > {suite.max_queries}"
+            )
+        if max_p95 is not None and result["p95"] > max_p95:
+            problems.append(f"p95 {result['p95']:.2f} > {max_p95} мс")
+        return problems
@@ -0,0 +1,132 @@
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+
+from recipes.cook_index import cook_index
+from recipes.search import ingredient_index
+
+COUNTERS = (
+    ("db_queries_total", "Количество SQL-запросов"),
+    ("db_seconds_total", "Время выполнения SQL-запросов"),
+    (
+        "app_seconds_total",
+        "Время в коде приложения без SQL, сериализации и рендеринга",
+    ),
+    ("serialize_seconds_total", "Время сериализации без SQL"),
+    ("render_seconds_total", "Время рендеринга ответа"),
+    ("response_bytes_total", "Размер ответов"),
+    ("query_budget_exceeded_total", "Превышения бюджета SQL-запросов"),
+)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - start
+
+
+@contextmanager
+def serialization_timer(request):
+    request = getattr(request, "_request", request)
+    if request is None or getattr(request, "serializing", False):
+        # Вложенный сериализатор уже учтён во внешнем.
+        yield
+        return
+    stats = getattr(request, "query_stats", None)
+    db_start = stats.duration if stats is not None else 0.0
+    request.serializing = True
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        request.serializing = False
+        elapsed = perf_counter() - start
+        if stats is not None:
+            elapsed -= stats.duration - db_start
+        request.serialize_time = getattr(request, "serialize_time", 0.0) + (
+            elapsed
+        )
+
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with serialization_timer(self.context.get("request")):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = perf_counter()
+        content = super().render(data, accepted_media_type, renderer_context)
+        request = (renderer_context or {}).get("request")
+        if request is not None:
+            request._request.render_time = perf_counter() - start
+        return content
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.counters = defaultdict(lambda: defaultdict(float))
+
+    def record(self, view, method, status, **values):
+        with self.lock:
+            self.requests[(view, method, status)] += 1
+            for name, value in values.items():
+                self.counters[view][name] += value
+
+    def render(self):
+        pid = os.getpid()
+        lines = [
+            "# HELP foodgram_http_requests_total Количество запросов",
+            "# TYPE foodgram_http_requests_total counter",
+        ]
+        with self.lock:
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'foodgram_http_requests_total{{pid="{pid}",'
+                    f'view="{view}",method="{method}",status="{status}"}} '
+                    f"{count}"
+                )
+            for name, description in COUNTERS:
+                lines.append(f"# HELP foodgram_{name} {description}")
+                lines.append(f"# TYPE foodgram_{name} counter")
+                for view, values in sorted(self.counters.items()):
+                    lines.append(
+                        f'foodgram_{name}{{pid="{pid}",view="{view}"}} '
+                        f"{values[name]:g}"
+                    )
+        for prefix, stats in (
+            ("ingredient_index", ingredient_index.stats()),
+            ("cook_index", cook_index.stats()),
+        ):
+            for name, value in stats.items():
+                if value is None:
+                    continue
+                lines.append(f"# TYPE foodgram_{prefix}_{name} gauge")
+                lines.append(
+                    f'foodgram_{prefix}_{name}{{pid="{pid}"}} {value}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,102 @@
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import QueryStats, registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        stats = QueryStats()
+        request.query_stats = stats
+        start = perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        elapsed = perf_counter() - start
+
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request,
+                response,
+                iter(response.streaming_content),
+                stats,
+                start,
+            )
+            return response
+
+        render = getattr(request, "render_time", 0.0)
+        serialize = getattr(request, "serialize_time", 0.0)
+        app = elapsed - stats.duration - serialize - render
+        response["Server-Timing"] = ", ".join(
+            (
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} SQL"',
+                f"serialize;dur={serialize * 1000:.1f}",
+                f"render;dur={render * 1000:.1f}",
+                f"app;dur={app * 1000:.1f}",
+                f"total;dur={elapsed * 1000:.1f}",
+            )
+        )
+        self.record(request, response, stats, elapsed, len(response.content))
+        return response
+
+    def stream(self, request, response, iterator, stats, start):
+        size = 0
+        while True:
+            with connection.execute_wrapper(stats):
+                chunk = next(iterator, None)
+            if chunk is None:
+                break
+            size += len(chunk)
+            yield chunk
+        self.record(request, response, stats, perf_counter() - start, size)
+
+    def get_budget(self, view, method):
+        if method == "HEAD":
+            method = "GET"
+        budget = settings.QUERY_BUDGETS.get((view, method))
+        # Общий бюджет рассчитан на чтение: запись без своего бюджета
+        # не проверяется.
+        if budget is None and method == "GET":
+            budget = settings.QUERY_BUDGET
+        return budget
+
+    def record(self, request, response, stats, elapsed, size):
+        match = request.resolver_match
+        if match is None:
+            return
+        view = match.view_name
+        render = getattr(request, "render_time", 0.0)
+        serialize = getattr(request, "serialize_time", 0.0)
+        budget = self.get_budget(view, request.method)
+        exceeded = budget is not None and stats.count > budget
+        if exceeded:
+            logger.warning(
+                "%s %s: %d SQL-запросов при бюджете %d (%.1f мс в БД)",
+                request.method,
+                request.path,
+                stats.count,
+                budget,
+                stats.duration * 1000,
+            )
+        registry.record(
+            view,
+            request.method,
+            response.status_code,
+            db_queries_total=stats.count,
+            db_seconds_total=stats.duration,
+            app_seconds_total=elapsed - stats.duration - serialize - render,
+            serialize_seconds_total=serialize,
+            render_seconds_total=render,
+            response_bytes_total=size,
+            query_budget_exceeded_total=int(exceeded),
+        )
@@ -1,4 +1,11 @@
+from datetime import datetime, timezone
+from hashlib import md5
+
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_201_CREATED,
@@ -7,11 +14,33 @@ from rest_framework.status import (
     HTTP_401_UNAUTHORIZED,
 )
 
+from recipes.catalog import get_catalog_state
+
+from .paginators import CursorLimitPagination
+from .relations import change_relations
+from .serializers import IdListSerializer
+
+
+def catalog_etag(request, *args, **kwargs):
+    version, _ = get_catalog_state()
+    accept = md5(request.META.get("HTTP_ACCEPT", "").encode()).hexdigest()
+    return f"{version}-{accept[:8]}"
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    _, modified = get_catalog_state()
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+
+catalog_condition = condition(
+    etag_func=catalog_etag, last_modified_func=catalog_last_modified
+)
+
 
 class AddDelViewMixin:
     add_serializer = None
 
-    def add_remove_relation(self, obj_id, manager):
+    def add_remove_relation(self, obj_id, relation):
         assert self.add_serializer is not None, (
             f"{self.__class__.__name__} should include "
             "an `add_serializer` attribute."
@@ -21,30 +50,67 @@ class AddDelViewMixin:
         if user.is_anonymous:
             return Response(status=HTTP_401_UNAUTHORIZED)
 
-        managers = {
-            "follow_M2M": user.follow,
-            "is_favorite_M2M": user.favorites,
-            "shopping_cart_M2M": user.shopping_list,
-        }
-        manager = managers[manager]
+        try:
+            obj_id = int(obj_id)
+        except ValueError:
+            raise Http404
+
+        if self.request.method in ("GET", "POST"):
+            if change_relations(user, relation, [obj_id]):
+                obj = get_object_or_404(self.queryset, id=obj_id)
+                serializer = self.add_serializer(
+                    obj, context={"request": self.request}
+                )
+                return Response(serializer.data, status=HTTP_201_CREATED)
+        elif change_relations(user, relation, [obj_id], add=False):
+            return Response(status=HTTP_204_NO_CONTENT)
+
+        get_object_or_404(self.queryset, id=obj_id)
+        return Response(status=HTTP_400_BAD_REQUEST)
 
-        obj = get_object_or_404(self.queryset, id=obj_id)
-        serializer = self.add_serializer(
-            obj, context={"request": self.request}
+    def add_remove_relations(self, relation):
+        user = self.request.user
+        if user.is_anonymous:
+            return Response(status=HTTP_401_UNAUTHORIZED)
+
+        serializer = IdListSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        changed = change_relations(
+            user,
+            relation,
+            serializer.validated_data["ids"],
+            add=self.request.method == "POST",
         )
-        obj_exist = manager.filter(id=obj_id).exists()
+        return Response({"ids": sorted(changed)})
+
 
-        if (
-            self.request.method
-            in (
-                "GET",
-                "POST",
+class CatalogCacheMixin:
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.action in ("list", "retrieve"):
+            patch_cache_control(
+                response, public=True, max_age=0, must_revalidate=True
             )
-        ) and not obj_exist:
-            manager.add(obj)
-            return Response(serializer.data, status=HTTP_201_CREATED)
+        return response
 
-        if (self.request.method in ("DELETE",)) and obj_exist:
-            manager.remove(obj)
-            return Response(status=HTTP_204_NO_CONTENT)
-        return Response(status=HTTP_400_BAD_REQUEST)
+    @method_decorator(catalog_condition)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(catalog_condition)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class CursorPaginationMixin:
+    cursor_ordering = CursorLimitPagination.ordering
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params
+            if "cursor" in params or params.get("pagination") == "cursor":
+                self._paginator = CursorLimitPagination(self.cursor_ordering)
+        return super().paginator
@@ -1,5 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+
+class CursorLimitPagination(CursorPagination):
+    page_size_query_param = "limit"
+    ordering = ("-pub_date", "-id")
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
@@ -0,0 +1,56 @@
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed
+
+from .loaders import RELATIONS
+
+
+def get_relation_sql(name, add, count):
+    model, owner, target = RELATIONS[name]
+    owner = model._meta.get_field(owner)
+    target = model._meta.get_field(target)
+    target_model = target.related_model
+    quote = connection.ops.quote_name
+    params = ", ".join(["%s"] * count)
+    if add:
+        sql = (
+            f"INSERT INTO {quote(model._meta.db_table)} "
+            f"({quote(owner.column)}, {quote(target.column)}) "
+            f"SELECT %s, {quote(target_model._meta.pk.column)} "
+            f"FROM {quote(target_model._meta.db_table)} "
+            f"WHERE {quote(target_model._meta.pk.column)} IN ({params}) "
+            f"ON CONFLICT DO NOTHING RETURNING {quote(target.column)}"
+        )
+    else:
+        sql = (
+            f"DELETE FROM {quote(model._meta.db_table)} "
+            f"WHERE {quote(owner.column)} = %s "
+            f"AND {quote(target.column)} IN ({params}) "
+            f"RETURNING {quote(target.column)}"
+        )
+    return sql
+
+
+def change_relations(user, name, ids, add=True):
+    ids = sorted(set(ids))
+    if not ids:
+        return set()
+
+    model, _, target = RELATIONS[name]
+    sql = get_relation_sql(name, add, len(ids))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, *ids])
+            changed = {row[0] for row in cursor.fetchall()}
+        if changed:
+            # Сигнал нужен счётчикам, спискам покупок и кешу рецептов,
+            # которые раньше обновлялись через add()/remove() менеджера.
+            m2m_changed.send(
+                sender=model,
+                instance=user,
+                action="post_add" if add else "post_remove",
+                reverse=model._meta.auto_created is not type(user),
+                model=model._meta.get_field(target).related_model,
+                pk_set=changed,
+                using=connection.alias,
+            )
+    return changed
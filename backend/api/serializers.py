@@ -1,34 +1,67 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from rest_framework import serializers
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe, Tag, detail_prefetches
+from recipes.payloads import get_recipe_payload
+from recipes.signals import ingredients_changed
 from users.models import User
 
-from .utils import check_value_validate, enter_ingredient_quantity_in_recipe
+from .fields import RecipeImageField
+from .loaders import get_user_relations
+from .metrics import TimedListSerializer, TimedSerializerMixin
+from .utils import (
+    check_value_validate,
+    enter_ingredient_quantity_in_recipe,
+    get_objects_by_ids,
+    get_recipes_limit,
+    update_ingredient_quantity_in_recipe,
+)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class PreloadListSerializer(TimedListSerializer):
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, Manager) else data
+        self.child.preload(items)
+        return super().to_representation(items)
+
+
+class IdListSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RELATIONS_BULK_LIMIT,
+    )
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = "__all__"
         read_only_fields = ("__all__",)
+        list_serializer_class = TimedListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = "__all__"
         read_only_fields = ("__all__",)
+        list_serializer_class = TimedListSerializer
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image = RecipeImageField(variant="card", read_only=True)
+
     class Meta:
         model = Recipe
         fields = "id", "name", "image", "cooking_time"
         read_only_fields = ("__all__",)
+        list_serializer_class = TimedListSerializer
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -44,12 +77,20 @@ class UserSerializer(serializers.ModelSerializer):
         )
         extra_kwargs = {"password": {"write_only": True}}
         read_only_fields = ("is_subscribed",)
+        list_serializer_class = PreloadListSerializer
+
+    def preload(self, authors):
+        get_user_relations(self.context).preload(
+            "follows", [author.pk for author in authors]
+        )
 
     def get_is_subscribed(self, author):
         user = self.context.get("request").user
         if user.is_anonymous or (user == author):
             return False
-        return user.follow.filter(id=author.id).exists()
+        if hasattr(author, "is_subscribed"):
+            return author.is_subscribed
+        return get_user_relations(self.context).is_subscribed(author)
 
     def create(self, validated_data):
         user = User(
@@ -63,7 +104,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField(read_only=True)
     recipes_count = serializers.SerializerMethodField()
 
@@ -79,29 +120,31 @@ class FollowSerializer(serializers.ModelSerializer):
             "recipes_count",
         )
         read_only_fields = ("__all__",)
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(**args):
         return True
 
     def get_recipes_count(self, author):
-        return author.recipes.count()
+        return author.recipes_count
 
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        recipes = obj.recipes.all()
-        limit = request.query_params.get("recipes_limit")
-        if limit:
-            recipes = recipes[: int(limit)]
+        recipes = getattr(obj, "recent_recipes", None)
+        if recipes is None:
+            recipes = obj.recipes.order_by("-pub_date")
+            limit = get_recipes_limit(self.context.get("request"))
+            if limit is not None:
+                recipes = recipes[:limit]
         return ShortRecipeSerializer(recipes, many=True).data
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = RecipeImageField(variant="detail")
 
     class Meta:
         model = Recipe
@@ -117,33 +160,65 @@ class RecipeSerializer(serializers.ModelSerializer):
             "text",
             "cooking_time",
         )
+        list_serializer_class = PreloadListSerializer
+
+    def preload(self, recipes):
+        recipes = list(recipes)
+        if not recipes or hasattr(recipes[0], "is_favorited"):
+            return
+        relations = get_user_relations(self.context)
+        recipe_ids = [recipe.pk for recipe in recipes]
+        relations.preload("favorites", recipe_ids)
+        relations.preload("shopping_cart", recipe_ids)
+        relations.preload("follows", {recipe.author_id for recipe in recipes})
+
+    def to_representation(self, recipe):
+        if hasattr(recipe, "author_is_subscribed"):
+            recipe.author.is_subscribed = recipe.author_is_subscribed
+        return super().to_representation(recipe)
+
+    def to_cached_representation(self, recipe):
+        data = get_recipe_payload(
+            recipe.pk, lambda: self.shared_representation(recipe)
+        )
+        if hasattr(recipe, "author_is_subscribed"):
+            recipe.author.is_subscribed = recipe.author_is_subscribed
+        data["author"]["is_subscribed"] = self.fields[
+            "author"
+        ].get_is_subscribed(recipe.author)
+        data["is_favorited"] = self.get_is_favorited(recipe)
+        data["is_in_shopping_cart"] = self.get_is_in_shopping_cart(recipe)
+        if data["image"]:
+            request = self.context.get("request")
+            data["image"] = request.build_absolute_uri(data["image"])
+        return data
+
+    def shared_representation(self, recipe):
+        prefetch_related_objects([recipe], *detail_prefetches())
+        data = self.to_representation(recipe)
+        data["image"] = recipe.get_image_url(self.fields["image"].variant)
+        return data
 
     def get_ingredients(self, recipe):
-        ingredients = recipe.ingredient.values(
-            "ingredients__id",
-            "ingredients__name",
-            "ingredients__measurement_unit",
-            "amount",
-        )
         return [
             {
-                key.replace("ingredients__", ""): val
-                for key, val in ingredient.items()
+                "id": item.ingredients.id,
+                "name": item.ingredients.name,
+                "measurement_unit": item.ingredients.measurement_unit,
+                "amount": item.amount,
             }
-            for ingredient in ingredients
+            for item in recipe.ingredient.all()
         ]
 
     def get_is_favorited(self, obj):
-        user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return user.favorites.filter(id=obj.id).exists()
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
+        return get_user_relations(self.context).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, recipe):
-        user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return user.shopping_list.filter(id=recipe.id).exists()
+        if hasattr(recipe, "is_in_shopping_cart"):
+            return recipe.is_in_shopping_cart
+        return get_user_relations(self.context).is_in_shopping_cart(recipe)
 
     def validate(self, data):
         name = str(self.initial_data.get("name")).strip()
@@ -157,19 +232,25 @@ class RecipeSerializer(serializers.ModelSerializer):
                     f'"{value}" должен быть в формате "[]"'
                 )
 
-        for tag in tags:
-            check_value_validate(tag, Tag)
+        get_objects_by_ids(tags, Tag)
+
+        ingredient_ids = [ing.get("id") for ing in ingredients]
+        ingredient_objects = get_objects_by_ids(ingredient_ids, Ingredient)
+        if len(ingredient_objects) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                "Ингредиенты не должны повторяться"
+            )
 
         valid_ingredients = []
         for ing in ingredients:
-            ing_id = ing.get("id")
-            ingredient = check_value_validate(ing_id, Ingredient)
-
             amount = ing.get("amount")
             check_value_validate(amount)
 
             valid_ingredients.append(
-                {"ingredient": ingredient, "amount": amount}
+                {
+                    "ingredient": ingredient_objects[int(ing["id"])],
+                    "amount": amount,
+                }
             )
 
         data["name"] = name.capitalize()
@@ -178,6 +259,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         data["author"] = self.context.get("request").user
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         image = validated_data.pop("image")
         tags = validated_data.pop("tags")
@@ -185,11 +267,17 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(image=image, **validated_data)
         recipe.tags.set(tags)
         enter_ingredient_quantity_in_recipe(recipe, ingredients)
-        return recipe
+        ingredients_changed.send(
+            sender=Recipe,
+            recipe_id=recipe.pk,
+            ingredient_ids=[item["ingredient"].id for item in ingredients],
+        )
+        return self.reload(recipe)
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         tags = validated_data.get("tags")
-        ingredients = validated_data.get("ingredient")
+        ingredients = validated_data.get("ingredients")
         recipe.image = validated_data.get("image", recipe.image)
         recipe.name = validated_data.get("name", recipe.name)
         recipe.text = validated_data.get("text", recipe.text)
@@ -197,13 +285,43 @@ class RecipeSerializer(serializers.ModelSerializer):
             "cooking_time", recipe.cooking_time
         )
 
-        if tags:
-            recipe.tags.clear()
+        if tags is not None:
             recipe.tags.set(tags)
 
-        if ingredients:
-            recipe.ingredients.clear()
-            enter_ingredient_quantity_in_recipe(recipe, ingredients)
+        if ingredients is not None:
+            changed = update_ingredient_quantity_in_recipe(recipe, ingredients)
+            if changed:
+                ingredients_changed.send(
+                    sender=Recipe, recipe_id=recipe.pk, ingredient_ids=changed
+                )
 
         recipe.save()
-        return recipe
+        return self.reload(recipe)
+
+    def reload(self, recipe):
+        user = self.context.get("request").user
+        return (
+            Recipe.objects.with_details()
+            .annotate_user_flags(user)
+            .get(pk=recipe.pk)
+        )
+
+
+class RecipeListSerializer(RecipeSerializer):
+    image = RecipeImageField(variant="card")
+
+
+class CookableRecipeSerializer(RecipeListSerializer):
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeListSerializer.Meta):
+        fields = RecipeListSerializer.Meta.fields + ("missing_ingredients",)
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.COOK_INDEX_MAX_INGREDIENTS,
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
@@ -0,0 +1,1185 @@
+import base64
+import io
+import shutil
+import tempfile
+import tracemalloc
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from api.authentication import token_cache_key
+from api.benchmarks import explain
+from api.fields import RecipeImageField
+from recipes.cook_index import cook_index
+from recipes.models import (
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingListItem,
+    SimilarRecipe,
+    Tag,
+)
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+GIF = (
+    "data:image/gif;base64,"
+    "R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw=="
+)
+
+
+def encode_image(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=95)
+    data = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/{image_format.lower()};base64,{data}"
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class RecipeListQueriesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader",
+            email="reader@foodgram.ru",
+            password="pass12345!",
+            first_name="Читатель",
+            last_name="Читателев",
+        )
+        author = User.objects.create_user(
+            username="author",
+            email="author@foodgram.ru",
+            password="pass12345!",
+            first_name="Автор",
+            last_name="Авторов",
+        )
+        tags = [
+            Tag.objects.create(name=f"Тег {i}", slug=f"tag-{i}")
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {i}", measurement_unit="г"
+            )
+            for i in range(5)
+        ]
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=f"Рецепт {i}", text="Описание"
+            )
+            for i in range(30)
+        ]
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredients=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in ingredients
+        )
+        for recipe in recipes:
+            recipe.tags.set(tags)
+        cls.user.follow.add(author)
+        cls.user.favorites.add(*recipes[::2])
+        cls.user.shopping_list.add(*recipes[::3])
+        cls.favorited = {recipe.id for recipe in recipes[::2]}
+        cls.in_cart = {recipe.id for recipe in recipes[::3]}
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_list_queries(self, expected):
+        for limit in (6, 30):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(f"/api/recipes/?limit={limit}")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["results"]), limit)
+
+    def test_anonymous_list_queries(self):
+        self.assert_list_queries(4)
+
+    def test_authenticated_list_queries(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(4)
+
+    def test_list_reads_user_flags(self):
+        self.client.force_authenticate(self.user)
+        results = self.client.get("/api/recipes/?limit=30").data["results"]
+        self.assertEqual(
+            {item["id"] for item in results if item["is_favorited"]},
+            self.favorited,
+        )
+        self.assertEqual(
+            {item["id"] for item in results if item["is_in_shopping_cart"]},
+            self.in_cart,
+        )
+        self.assertTrue(
+            all(item["author"]["is_subscribed"] for item in results)
+        )
+        self.assertTrue(all(len(item["ingredients"]) == 5 for item in results))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class RecipeCreateQueriesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="cook",
+            email="cook@foodgram.ru",
+            password="pass12345!",
+            first_name="Повар",
+            last_name="Поваров",
+        )
+        cls.tags = [
+            Tag.objects.create(name=f"Тег {i}", slug=f"tag-{i}")
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {i}", measurement_unit="г"
+            )
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def payload(self, ingredients):
+        return {
+            "name": "Суп",
+            "text": "Описание",
+            "cooking_time": 5,
+            "image": GIF,
+            "tags": [tag.id for tag in self.tags],
+            "ingredients": ingredients,
+        }
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        for count in (1, 30):
+            with self.subTest(ingredients=count):
+                ingredients = [
+                    {"id": ingredient.id, "amount": 10}
+                    for ingredient in self.ingredients[:count]
+                ]
+                # Учитываются и запросы, выполняемые после коммита.
+                with self.assertNumQueries(20), self.captureOnCommitCallbacks(
+                    execute=True
+                ):
+                    response = self.client.post(
+                        "/api/recipes/",
+                        self.payload(ingredients),
+                        format="json",
+                    )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data["ingredients"]), count)
+
+    def test_duplicate_ingredients_are_rejected(self):
+        ingredient = self.ingredients[0]
+        response = self.client.post(
+            "/api/recipes/",
+            self.payload(
+                [
+                    {"id": ingredient.id, "amount": 1},
+                    {"id": f"0{ingredient.id}", "amount": 2},
+                ]
+            ),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeFilterTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="filter",
+            email="filter@foodgram.ru",
+            password="pass12345!",
+            first_name="Фильтр",
+            last_name="Фильтров",
+        )
+        cls.other = User.objects.create_user(
+            username="other",
+            email="other@foodgram.ru",
+            password="pass12345!",
+            first_name="Другой",
+            last_name="Другов",
+        )
+        tags = [
+            Tag.objects.create(name=f"Тег {i}", slug=f"tag-{i}")
+            for i in range(3)
+        ]
+        for i in range(40):
+            recipe = Recipe.objects.create(
+                author=cls.user if i % 2 else cls.other,
+                name=f"Рецепт {i}",
+                text="Описание",
+            )
+            # У большинства рецептов несколько подходящих тегов: JOIN по
+            # тегам без DISTINCT вернул бы их по нескольку раз.
+            recipe.tags.set(tags[: i % 3 + 1])
+            if i % 4 == 0:
+                recipe.is_favorite.add(cls.user)
+            if i % 5 == 0:
+                recipe.is_in_shopping_list.add(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def fetch_ids(self, query):
+        ids = []
+        url = f"/api/recipes/?limit=7&{query}"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for captured in queries.captured_queries:
+                self.assertNotIn("DISTINCT", captured["sql"].upper())
+            ids.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(len(ids), len(set(ids)))
+        return set(ids)
+
+    def expected_ids(self, **lookups):
+        recipes = Recipe.objects.filter(**lookups)
+        return set(recipes.values_list("id", flat=True))
+
+    def test_filters_match_without_duplicates(self):
+        user = self.user
+        cases = (
+            ("tags=tag-0&tags=tag-1&tags=tag-2", {}),
+            ("tags=tag-2", {"tags__slug": "tag-2"}),
+            (f"author={user.id}", {"author": user}),
+            ("is_favorited=1", {"is_favorite": user}),
+            ("is_in_shopping_cart=1", {"is_in_shopping_list": user}),
+            (
+                f"tags=tag-1&tags=tag-2&author={user.id}&is_favorited=1",
+                {
+                    "tags__slug__in": ("tag-1", "tag-2"),
+                    "author": user,
+                    "is_favorite": user,
+                },
+            ),
+            (
+                "tags=tag-0&tags=tag-1&is_in_shopping_cart=1",
+                {
+                    "tags__slug__in": ("tag-0", "tag-1"),
+                    "is_in_shopping_list": user,
+                },
+            ),
+        )
+        for query, lookups in cases:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.fetch_ids(query), self.expected_ids(**lookups)
+                )
+
+    def test_negative_filters(self):
+        self.assertEqual(
+            self.fetch_ids("is_favorited=0&tags=tag-0&tags=tag-1"),
+            set(
+                Recipe.objects.exclude(is_favorite=self.user).values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+
+    def test_anonymous_user_filters(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.fetch_ids("is_favorited=1"), set())
+        self.assertEqual(len(self.fetch_ids("is_in_shopping_cart=0")), 40)
+
+
+class RecipeFilterPlanTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Планы запросов проверяются на объёме, при котором планировщик
+        # уже выбирает между индексами, а не просматривает таблицы целиком.
+        call_command(
+            "generate_data",
+            "--users=60",
+            "--recipes=3000",
+            "--favorites=150",
+            "--cart=60",
+            stdout=io.StringIO(),
+        )
+        cls.user = User.objects.annotate(
+            favorites_total=Count("favorites")
+        ).latest("favorites_total")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_filters_do_not_deduplicate(self):
+        user = self.user
+        cases = (
+            ("tags=breakfast&tags=lunch&tags=dinner", {}),
+            ("tags=lunch", {"tags__slug": "lunch"}),
+            ("is_favorited=1", {"is_favorite": user}),
+            ("is_in_shopping_cart=1", {"is_in_shopping_list": user}),
+            ("is_favorited=0&tags=lunch", {"tags__slug": "lunch"}),
+            (
+                "tags=lunch&tags=dinner&is_favorited=1",
+                {
+                    "tags__slug__in": ("lunch", "dinner"),
+                    "is_favorite": user,
+                },
+            ),
+        )
+        for query, lookups in cases:
+            with self.subTest(query=query):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(f"/api/recipes/?{query}")
+                self.assertEqual(response.status_code, 200)
+                recipes = Recipe.objects.filter(**lookups)
+                if "is_favorited=0" in query:
+                    recipes = recipes.exclude(is_favorite=user)
+                self.assertEqual(
+                    response.data["count"],
+                    len(set(recipes.values_list("id", flat=True))),
+                )
+                plans = [
+                    explain(captured["sql"])
+                    for captured in queries.captured_queries
+                    if captured["sql"].startswith(
+                        'SELECT "recipes_recipe"."id"'
+                    )
+                ]
+                self.assertTrue(plans)
+                for plan in plans:
+                    self.assertNotIn("DISTINCT", plan.upper())
+                    self.assertNotIn("Unique", plan)
+
+
+@override_settings(
+    FILE_UPLOAD_MAX_MEMORY_SIZE=256 * 1024,
+    RECIPE_IMAGE_MAX_SIZE=8 * 1024**2,
+    RECIPE_IMAGE_MAX_SIDE=3000,
+)
+class RecipeImageFieldTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Шум почти не сжимается: картинка весит несколько мегабайт.
+        cls.large = encode_image(
+            Image.effect_noise((2000, 2000), 60).convert("RGB"), "JPEG"
+        )
+
+    def decode(self, data):
+        file = RecipeImageField().to_internal_value(data)
+        self.addCleanup(file.close)
+        return file
+
+    def assert_rejected(self, data, code):
+        with self.assertRaises(ValidationError) as error:
+            RecipeImageField().to_internal_value(data)
+        self.assertEqual(error.exception.detail[0].code, code)
+
+    def test_decoding_memory_does_not_grow_with_image(self):
+        size = len(self.large) * 3 // 4
+        tracemalloc.start()
+        try:
+            file = self.decode(self.large)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(file.size, 2 * 1024**2)
+        self.assertLess(peak, 1024**2)
+        self.assertLess(peak, size // 4)
+
+    def test_small_image_is_accepted(self):
+        file = self.decode(encode_image(Image.new("RGB", (30, 20)), "PNG"))
+        self.assertTrue(file.name.endswith(".png"))
+        self.assertEqual(file.content_type, "image/png")
+
+    def test_oversized_payload_is_rejected(self):
+        with override_settings(RECIPE_IMAGE_MAX_SIZE=1024**2):
+            self.assert_rejected(self.large, "image_too_large")
+
+    def test_too_wide_image_is_rejected(self):
+        self.assert_rejected(
+            encode_image(Image.new("RGB", (3001, 10)), "PNG"),
+            "image_too_wide",
+        )
+
+    def test_bad_base64_is_rejected(self):
+        for data in (
+            "data:image/png;base64,!!!notbase64!!",
+            "data:image/png;base64,iVBORw0KGgo",
+            base64.b64encode(b"not an image at all").decode(),
+        ):
+            with self.subTest(data=data):
+                self.assert_rejected(data, "invalid_image")
+
+    def test_unsupported_format_is_rejected(self):
+        self.assert_rejected(
+            encode_image(Image.new("RGB", (10, 10)), "BMP"), "image_format"
+        )
+
+
+class QueryBudgetTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(
+            username="budget",
+            email="budget@foodgram.ru",
+            password="pass12345!",
+            first_name="Бюджет",
+            last_name="Бюджетов",
+        )
+        author = User.objects.create_user(
+            username="chef",
+            email="chef@foodgram.ru",
+            password="pass12345!",
+            first_name="Шеф",
+            last_name="Шефов",
+        )
+        tag = Tag.objects.create(name="Обед", slug="lunch")
+        ingredients = [
+            Ingredient.objects.create(name=f"соль {i}", measurement_unit="г")
+            for i in range(10)
+        ]
+        for i in range(10):
+            recipe = Recipe.objects.create(
+                author=author, name=f"Рецепт {i}", text="Описание"
+            )
+            recipe.tags.add(tag)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredients=item, amount=1)
+                for item in ingredients[:3]
+            )
+        user.follow.add(author)
+        cls.token = Token.objects.create(user=user)
+        cls.urls = {
+            ("api:ingredients-list", "GET"): "/api/ingredients/",
+            ("api:recipes-list", "GET"): "/api/recipes/",
+            ("api:recipes-detail", "GET"): f"/api/recipes/{recipe.pk}/",
+            ("api:users-subscriptions", "GET"): (
+                "/api/users/subscriptions/?recipes_limit=3"
+            ),
+        }
+
+    def test_every_budget_is_covered(self):
+        self.assertEqual(set(settings.QUERY_BUDGETS), set(self.urls))
+
+    def test_views_fit_their_budgets(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        for key, budget in settings.QUERY_BUDGETS.items():
+            with self.subTest(view=key):
+                # Холодные кеши: токен, каталоги и карточки рецептов.
+                cache.clear()
+                with self.assertNumQueries(budget):
+                    response = self.client.generic(key[1], self.urls[key])
+                self.assertEqual(response.status_code, 200)
+
+
+class RelationsTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="fan",
+            email="fan@foodgram.ru",
+            password="pass12345!",
+            first_name="Фанат",
+            last_name="Фанатов",
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f"chef{i}",
+                email=f"chef{i}@foodgram.ru",
+                password="pass12345!",
+                first_name="Шеф",
+                last_name="Шефов",
+            )
+            for i in range(3)
+        ]
+        cls.salt, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("соль", "мука")
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.authors[0], name=f"Рецепт {i}", text="Описание"
+            )
+            for i in range(3)
+        ]
+        IngredientInRecipe.objects.bulk_create(
+            [
+                IngredientInRecipe(
+                    recipe=cls.recipes[0], ingredients=cls.salt, amount=100
+                ),
+                IngredientInRecipe(
+                    recipe=cls.recipes[0], ingredients=cls.flour, amount=50
+                ),
+                IngredientInRecipe(
+                    recipe=cls.recipes[1], ingredients=cls.salt, amount=20
+                ),
+            ]
+        )
+        cls.missing_id = 10**6
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def change_many(self, method, url, ids):
+        send = self.client.post if method == "POST" else self.client.delete
+        response = send(url, {"ids": ids}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.data["ids"]
+
+    def favorites_counts(self):
+        return list(
+            Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in self.recipes]
+            )
+            .order_by("pk")
+            .values_list("favorites_count", flat=True)
+        )
+
+    def followers_counts(self):
+        return list(
+            User.objects.filter(pk__in=[user.pk for user in self.authors])
+            .order_by("pk")
+            .values_list("followers_count", flat=True)
+        )
+
+    def shopping_list(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user).values_list(
+                "ingredient_id", "amount"
+            )
+        )
+
+    def test_single_favorite(self):
+        url = f"/api/recipes/{self.recipes[0].pk}/favorite/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.favorites_counts(), [1, 0, 0])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.favorites_counts(), [0, 0, 0])
+        response = self.client.post(
+            f"/api/recipes/{self.missing_id}/favorite/"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_favorites(self):
+        url = "/api/recipes/favorite/"
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        ids = [second, first, second, self.missing_id]
+        self.assertEqual(self.change_many("POST", url, ids), [first, second])
+        self.assertEqual(
+            self.change_many("POST", url, [second, third]), [third]
+        )
+        self.assertEqual(self.favorites_counts(), [1, 1, 1])
+        self.assertEqual(
+            self.change_many("DELETE", url, [first, third, self.missing_id]),
+            [first, third],
+        )
+        self.assertEqual(self.change_many("DELETE", url, [first]), [])
+        self.assertEqual(self.favorites_counts(), [0, 1, 0])
+        self.assertEqual(
+            set(self.user.favorites.values_list("id", flat=True)), {second}
+        )
+
+    def test_single_shopping_cart(self):
+        url = f"/api/recipes/{self.recipes[0].pk}/shopping_cart/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(
+            self.shopping_list(), {self.salt.pk: 100, self.flour.pk: 50}
+        )
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.shopping_list(), {})
+
+    def test_bulk_shopping_cart(self):
+        url = "/api/recipes/shopping_cart/"
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        self.assertEqual(
+            self.change_many("POST", url, [first, second, first]),
+            [first, second],
+        )
+        self.assertEqual(
+            self.change_many("POST", url, [first, third]), [third]
+        )
+        self.assertEqual(
+            self.shopping_list(), {self.salt.pk: 120, self.flour.pk: 50}
+        )
+        self.assertEqual(self.change_many("DELETE", url, [first]), [first])
+        self.assertEqual(self.change_many("DELETE", url, [first]), [])
+        self.assertEqual(self.shopping_list(), {self.salt.pk: 20})
+        self.assertEqual(
+            self.change_many("DELETE", url, [second, third]), [second, third]
+        )
+        self.assertEqual(self.shopping_list(), {})
+
+    def test_single_follow(self):
+        url = f"/api/users/{self.authors[0].pk}/subscribe/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.followers_counts(), [1, 0, 0])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.followers_counts(), [0, 0, 0])
+
+    def test_bulk_follows(self):
+        url = "/api/users/subscribe/"
+        first, second, third = (user.pk for user in self.authors)
+        self.assertEqual(
+            self.change_many("POST", url, [first, second, self.missing_id]),
+            [first, second],
+        )
+        self.assertEqual(
+            self.change_many("POST", url, [second, third]), [third]
+        )
+        self.assertEqual(self.followers_counts(), [1, 1, 1])
+        self.assertEqual(
+            self.change_many("DELETE", url, [first, second]), [first, second]
+        )
+        self.assertEqual(self.change_many("DELETE", url, [second]), [])
+        self.assertEqual(self.followers_counts(), [0, 0, 1])
+
+
+class CountersTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second, cls.fan = (
+            User.objects.create_user(
+                username=name,
+                email=f"{name}@foodgram.ru",
+                password="pass12345!",
+                first_name="Имя",
+                last_name="Фамилия",
+            )
+            for name in ("first", "second", "fan")
+        )
+
+    def counts(self, user):
+        user.refresh_from_db()
+        return user.recipes_count, user.followers_count
+
+    def test_recipes_count_follows_author(self):
+        recipe = Recipe.objects.create(
+            author=self.first, name="Суп", text="Описание"
+        )
+        Recipe.objects.create(author=self.first, name="Щи", text="Описание")
+        self.assertEqual(self.counts(self.first), (2, 0))
+
+        recipe.author = self.second
+        recipe.save()
+        self.assertEqual(self.counts(self.first), (1, 0))
+        self.assertEqual(self.counts(self.second), (1, 0))
+
+        recipe.name = "Борщ"
+        recipe.save()
+        self.assertEqual(self.counts(self.second), (1, 0))
+
+        recipe.delete()
+        self.assertEqual(self.counts(self.second), (0, 0))
+        self.assertEqual(self.counts(self.first), (1, 0))
+
+    def test_deleted_user_releases_counters(self):
+        recipe = Recipe.objects.create(
+            author=self.first, name="Суп", text="Описание"
+        )
+        self.fan.favorites.add(recipe)
+        self.fan.follow.add(self.first, self.second)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.counts(self.second), (0, 1))
+
+        self.fan.delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(self.counts(self.first), (1, 0))
+        self.assertEqual(self.counts(self.second), (0, 0))
+
+    def test_cleared_relations_update_counters(self):
+        recipe = Recipe.objects.create(
+            author=self.first, name="Суп", text="Описание"
+        )
+        self.fan.favorites.add(recipe)
+        self.fan.follow.add(self.first)
+        self.fan.favorites.clear()
+        self.fan.follow.clear()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(self.counts(self.first), (1, 0))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class ShoppingListTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.buyer, cls.other = (
+            User.objects.create_user(
+                username=name,
+                email=f"{name}@foodgram.ru",
+                password="pass12345!",
+                first_name="Имя",
+                last_name="Фамилия",
+            )
+            for name in ("author", "buyer", "other")
+        )
+        cls.tag = Tag.objects.create(name="Обед", slug="lunch")
+        cls.salt, cls.flour, cls.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("соль", "мука", "сахар")
+        )
+        cls.soup, cls.bread = (
+            Recipe.objects.create(
+                author=cls.author, name=name, text="Описание"
+            )
+            for name in ("Суп", "Хлеб")
+        )
+        IngredientInRecipe.objects.bulk_create(
+            [
+                IngredientInRecipe(
+                    recipe=cls.soup, ingredients=cls.salt, amount=100
+                ),
+                IngredientInRecipe(
+                    recipe=cls.soup, ingredients=cls.flour, amount=50
+                ),
+                IngredientInRecipe(
+                    recipe=cls.bread, ingredients=cls.salt, amount=20
+                ),
+            ]
+        )
+
+    def shopping_list(self, user):
+        return dict(
+            ShoppingListItem.objects.filter(user=user).values_list(
+                "ingredient_id", "amount"
+            )
+        )
+
+    def edit_soup(self, ingredients):
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f"/api/recipes/{self.soup.pk}/",
+            {
+                "name": "Суп",
+                "text": "Описание",
+                "cooking_time": 5,
+                "image": GIF,
+                "tags": [self.tag.id],
+                "ingredients": [
+                    {"id": ingredient.id, "amount": amount}
+                    for ingredient, amount in ingredients
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_cart_changes_update_totals(self):
+        self.buyer.shopping_list.add(self.soup, self.bread)
+        self.other.shopping_list.add(self.bread)
+        self.assertEqual(
+            self.shopping_list(self.buyer),
+            {self.salt.pk: 120, self.flour.pk: 50},
+        )
+        self.assertEqual(self.shopping_list(self.other), {self.salt.pk: 20})
+
+        self.buyer.shopping_list.remove(self.soup)
+        self.assertEqual(self.shopping_list(self.buyer), {self.salt.pk: 20})
+
+        self.bread.is_in_shopping_list.clear()
+        self.assertEqual(self.shopping_list(self.buyer), {})
+        self.assertEqual(self.shopping_list(self.other), {})
+
+    def test_recipe_edit_updates_every_cart(self):
+        self.buyer.shopping_list.add(self.soup, self.bread)
+        self.other.shopping_list.add(self.soup)
+        self.edit_soup([(self.salt, 30), (self.sugar, 10)])
+        self.assertEqual(
+            self.shopping_list(self.buyer),
+            {self.salt.pk: 50, self.sugar.pk: 10},
+        )
+        self.assertEqual(
+            self.shopping_list(self.other),
+            {self.salt.pk: 30, self.sugar.pk: 10},
+        )
+
+    def test_deleted_recipe_and_ingredient_leave_cart(self):
+        self.buyer.shopping_list.add(self.soup, self.bread)
+        self.soup.delete()
+        self.assertEqual(self.shopping_list(self.buyer), {self.salt.pk: 20})
+        self.salt.delete()
+        self.assertEqual(self.shopping_list(self.buyer), {})
+
+
+class RecipePayloadCacheTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username="author",
+            email="author@foodgram.ru",
+            password="pass12345!",
+            first_name="Автор",
+            last_name="Авторов",
+        )
+        cls.tag = Tag.objects.create(name="Обед", slug="lunch")
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name="Суп", text="Описание"
+        )
+        cls.recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.url = f"/api/recipes/{self.recipe.pk}/"
+
+    def fetch(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_payload_is_cached(self):
+        self.fetch()
+        # update() не отправляет сигналов: карточка берётся из кеша.
+        Recipe.objects.filter(pk=self.recipe.pk).update(name="Борщ")
+        self.assertEqual(self.fetch()["name"], "Суп")
+
+    def test_recipe_change_invalidates_payload(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = "Борщ"
+            self.recipe.save()
+        self.assertEqual(self.fetch()["name"], "Борщ")
+
+    def test_tag_changes_invalidate_payload(self):
+        self.fetch()
+        self.tag.name = "Ужин"
+        self.tag.save()
+        self.assertEqual(
+            [tag["name"] for tag in self.fetch()["tags"]], ["Ужин"]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.clear()
+        self.assertEqual(self.fetch()["tags"], [])
+
+    def test_author_change_invalidates_payload(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = "Повар"
+            self.author.save()
+        self.assertEqual(self.fetch()["author"]["first_name"], "Повар")
+
+    def test_login_keeps_payload(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.author.pk).update(first_name="Повар")
+            self.author.save(update_fields=["last_login"])
+        self.assertEqual(self.fetch()["author"]["first_name"], "Автор")
+
+
+class TokenCacheTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader",
+            email="reader@foodgram.ru",
+            password="pass12345!",
+            first_name="Читатель",
+            last_name="Читателев",
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def me(self):
+        return self.client.get("/api/users/me/").status_code
+
+    def test_token_is_cached(self):
+        self.assertEqual(self.me(), 200)
+        self.assertIsNotNone(cache.get(token_cache_key(self.token.key)))
+
+    def test_logout_invalidates_token(self):
+        self.assertEqual(self.me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+        self.assertEqual(self.me(), 401)
+
+    def test_deactivation_invalidates_token(self):
+        self.assertEqual(self.me(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.me(), 401)
+
+    def test_login_keeps_token_cached(self):
+        self.assertEqual(self.me(), 200)
+        self.user.save(update_fields=["last_login"])
+        self.assertIsNotNone(cache.get(token_cache_key(self.token.key)))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class CookableTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username="author",
+            email="author@foodgram.ru",
+            password="pass12345!",
+            first_name="Автор",
+            last_name="Авторов",
+        )
+        cls.tag = Tag.objects.create(name="Обед", slug="lunch")
+        cls.salt, cls.flour, cls.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("соль", "мука", "сахар")
+        )
+        cls.bread, cls.soup, cls.cake = (
+            Recipe.objects.create(
+                author=cls.author, name=name, text="Описание"
+            )
+            for name in ("Хлеб", "Суп", "Торт")
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredients=item, amount=1)
+            for recipe, item in (
+                (cls.bread, cls.salt),
+                (cls.bread, cls.flour),
+                (cls.soup, cls.salt),
+                (cls.cake, cls.sugar),
+            )
+        )
+
+    def setUp(self):
+        cache.clear()
+        cook_index.invalidate()
+        self.client.force_authenticate(self.author)
+
+    def search(self, *ingredients, **params):
+        query = "&".join(f"ingredients={item.pk}" for item in ingredients)
+        for name, value in params.items():
+            query += f"&{name}={value}"
+        response = self.client.get(f"/api/recipes/cookable/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [
+            (item["id"], item["missing_ingredients"])
+            for item in response.data["results"]
+        ]
+
+    def test_ranking_by_missing_ingredients(self):
+        self.assertEqual(
+            self.search(self.salt), [(self.soup.pk, 0), (self.bread.pk, 1)]
+        )
+        self.assertEqual(
+            self.search(self.salt, self.flour, self.sugar),
+            [(self.cake.pk, 0), (self.soup.pk, 0), (self.bread.pk, 0)],
+        )
+        self.assertEqual(
+            self.search(self.salt, max_missing=0), [(self.soup.pk, 0)]
+        )
+
+    def test_recipe_edit_goes_through_changelog(self):
+        self.assertEqual(
+            self.search(self.salt), [(self.soup.pk, 0), (self.bread.pk, 1)]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/recipes/{self.soup.pk}/",
+                {
+                    "name": "Суп",
+                    "text": "Описание",
+                    "cooking_time": 5,
+                    "image": GIF,
+                    "tags": [self.tag.id],
+                    "ingredients": [
+                        {"id": self.salt.id, "amount": 1},
+                        {"id": self.flour.id, "amount": 1},
+                        {"id": self.sugar.id, "amount": 1},
+                    ],
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        loads = cook_index.stats()["loads"]
+        self.assertEqual(
+            self.search(self.salt), [(self.bread.pk, 1), (self.soup.pk, 2)]
+        )
+        self.assertEqual(
+            self.search(self.sugar),
+            [(self.cake.pk, 0), (self.soup.pk, 2)],
+        )
+        stats = cook_index.stats()
+        self.assertEqual(stats["loads"], loads)
+        self.assertEqual(stats["overlay"], 1)
+
+    def test_deleted_recipe_leaves_results(self):
+        self.search(self.sugar)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cake.delete()
+        self.assertEqual(self.search(self.sugar), [])
+        self.assertEqual(cook_index.stats()["overlay"], 1)
+
+
+class SimilarRecipesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username="author",
+            email="author@foodgram.ru",
+            password="pass12345!",
+            first_name="Автор",
+            last_name="Авторов",
+        )
+        lunch, dinner = (
+            Tag.objects.create(name=name, slug=slug)
+            for name, slug in (("Обед", "lunch"), ("Ужин", "dinner"))
+        )
+        salt, flour, egg, sugar, pepper, milk = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("соль", "мука", "яйцо", "сахар", "перец", "молоко")
+        )
+        compositions = (
+            ((salt, flour, egg), (lunch,)),
+            ((salt, flour), (lunch,)),
+            ((salt, sugar, milk), (dinner,)),
+            ((sugar, milk), (lunch, dinner)),
+            ((pepper,), ()),
+            ((egg, milk), (dinner,)),
+        )
+        cls.recipes = []
+        for number, (ingredients, tags) in enumerate(compositions):
+            recipe = Recipe.objects.create(
+                author=author, name=f"Рецепт {number}", text="Описание"
+            )
+            recipe.tags.set(tags)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredients=item, amount=1)
+                for item in ingredients
+            )
+            cls.recipes.append(recipe)
+
+    def expected_scores(self, tag_weight):
+        # Тот же расчёт напрямую, плотными матрицами.
+        recipes = [recipe.pk for recipe in self.recipes]
+        ingredient_ids = sorted(
+            Ingredient.objects.values_list("pk", flat=True)
+        )
+        tag_ids = sorted(Tag.objects.values_list("pk", flat=True))
+        ingredients = np.zeros((len(recipes), len(ingredient_ids)))
+        tags = np.zeros((len(recipes), len(tag_ids)))
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.values_list(
+            "recipe_id", "ingredients_id"
+        ):
+            row = recipes.index(recipe_id)
+            ingredients[row, ingredient_ids.index(ingredient_id)] = 1
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            "recipe_id", "tag_id"
+        ):
+            tags[recipes.index(recipe_id), tag_ids.index(tag_id)] = 1
+        frequency = ingredients.sum(axis=0)
+        ingredients *= np.log((1 + len(recipes)) / (1 + frequency)) + 1
+        vectors = [
+            matrix / np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)[:, None]
+            for matrix in (ingredients, tags)
+        ]
+        scores = (1 - tag_weight) * vectors[0] @ vectors[0].T
+        scores += tag_weight * vectors[1] @ vectors[1].T
+        # Сравниваются только рецепты с общими ингредиентами.
+        shared = ingredients @ ingredients.T > 0
+        return {
+            (recipes[row], recipes[column]): scores[row, column]
+            for row, column in zip(*np.nonzero(shared))
+            if row != column
+        }
+
+    def stored_scores(self):
+        rows = SimilarRecipe.objects.values_list(
+            "recipe_id", "similar_id", "score"
+        )
+        return {(recipe, similar): score for recipe, similar, score in rows}
+
+    def compute(self, *args):
+        call_command("compute_similar", *args, stdout=io.StringIO())
+
+    def test_scores_match_direct_calculation(self):
+        expected = self.expected_scores(0.3)
+        for budget in ("1", "1000"):
+            with self.subTest(budget=budget):
+                self.compute(
+                    "--max-frequency=1", "--top=10", f"--budget={budget}"
+                )
+                stored = self.stored_scores()
+                self.assertEqual(set(stored), set(expected))
+                for pair, score in expected.items():
+                    self.assertAlmostEqual(stored[pair], score, places=5)
+
+    def test_top_keeps_best_matches(self):
+        self.compute("--max-frequency=1", "--top=2")
+        expected = self.expected_scores(0.3)
+        for recipe in self.recipes:
+            best = sorted(
+                (
+                    (score, similar)
+                    for (owner, similar), score in expected.items()
+                    if owner == recipe.pk
+                ),
+                reverse=True,
+            )[:2]
+            stored = SimilarRecipe.objects.filter(recipe=recipe)
+            self.assertEqual(
+                set(stored.values_list("similar_id", flat=True)),
+                {similar for _, similar in best},
+            )
+
+    def test_common_ingredients_are_ignored(self):
+        # Соль есть в половине рецептов: без неё у рецептов 1 и 2
+        # не остаётся ни общих ингредиентов, ни общих тегов.
+        first, second = self.recipes[1].pk, self.recipes[2].pk
+        self.compute("--max-frequency=1")
+        self.assertIn((first, second), self.stored_scores())
+        self.compute("--max-frequency=0.4")
+        self.assertNotIn((first, second), self.stored_scores())
+
+    def test_similar_endpoint(self):
+        self.compute("--max-frequency=1", "--top=10")
+        recipe = self.recipes[0]
+        expected = sorted(
+            (
+                (-score, -similar, similar)
+                for (owner, similar), score in self.stored_scores().items()
+                if owner == recipe.pk
+            )
+        )
+        url = f"/api/recipes/{recipe.pk}/similar/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["id"] for item in response.data],
+            [similar for *_, similar in expected],
+        )
+        response = self.client.get(f"{url}?limit=1")
+        self.assertEqual(
+            [item["id"] for item in response.data], [expected[0][-1]]
+        )
+        response = self.client.get(
+            f"/api/recipes/{self.recipes[4].pk}/similar/"
+        )
+        self.assertEqual(response.data, [])
+        response = self.client.get("/api/recipes/1000000/similar/")
+        self.assertEqual(response.status_code, 404)
@@ -1,7 +1,13 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (
+    IngredientViewSet,
+    RecipeViewSet,
+    TagViewSet,
+    UserViewSet,
+    metrics,
+)
 
 app_name = "api"
 
@@ -14,6 +20,7 @@ router.register("users", UserViewSet, "users")
 
 
 urlpatterns = [
+    path("metrics/", metrics, name="metrics"),
     path("", include(router.urls)),
     path("auth/", include("djoser.urls")),
     path("auth/", include("djoser.urls.authtoken")),
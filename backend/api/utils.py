@@ -1,22 +1,130 @@
+import csv
+import json
+
+from django.conf import settings
+from django.utils import timezone as tz
 from rest_framework.serializers import ValidationError
 
 from recipes.models import IngredientInRecipe
 
 
 def enter_ingredient_quantity_in_recipe(recipe, ingredients):
-    for ingredient in ingredients:
-        IngredientInRecipe.objects.get_or_create(
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(
             recipe=recipe,
             ingredients=ingredient["ingredient"],
             amount=ingredient["amount"],
         )
+        for ingredient in ingredients
+    )
+
+
+def update_ingredient_quantity_in_recipe(recipe, ingredients):
+    current = {
+        item.ingredients_id: item
+        for item in IngredientInRecipe.objects.filter(recipe=recipe)
+    }
+    amounts = {
+        ingredient["ingredient"].id: int(ingredient["amount"])
+        for ingredient in ingredients
+    }
+
+    removed = current.keys() - amounts.keys()
+    if removed:
+        IngredientInRecipe.objects.filter(
+            recipe=recipe, ingredients_id__in=removed
+        ).delete()
+
+    changed = []
+    for ingredient_id, item in current.items():
+        amount = amounts.get(ingredient_id)
+        if amount is not None and item.amount != amount:
+            item.amount = amount
+            changed.append(item)
+    if changed:
+        IngredientInRecipe.objects.bulk_update(changed, ("amount",))
+
+    added = [
+        IngredientInRecipe(
+            recipe=recipe, ingredients_id=ingredient_id, amount=amount
+        )
+        for ingredient_id, amount in amounts.items()
+        if ingredient_id not in current
+    ]
+    if added:
+        IngredientInRecipe.objects.bulk_create(added)
 
+    return removed | {item.ingredients_id for item in changed + added}
 
-def check_value_validate(value, klass=None):
+
+def get_recipes_limit(request):
+    limit = request.query_params.get("recipes_limit")
+    if limit and limit.isdecimal():
+        return int(limit)
+    return None
+
+
+def get_similar_limit(request):
+    limit = request.query_params.get("limit")
+    if limit and limit.isdecimal():
+        return min(int(limit), settings.SIMILAR_RECIPES_COUNT)
+    return settings.SIMILAR_RECIPES_COUNT
+
+
+def check_value_validate(value):
     if not str(value).isdecimal():
         raise ValidationError(f"{value} должно содержать цифру")
-    if klass:
-        obj = klass.objects.filter(id=value)
-        if not obj:
-            raise ValidationError(f"{value} не существует")
-        return obj[0]
+
+
+def get_objects_by_ids(values, klass):
+    for value in values:
+        check_value_validate(value)
+    ids = {int(value) for value in values}
+    objects = klass.objects.in_bulk(ids)
+    missing = ids - objects.keys()
+    if missing:
+        raise ValidationError(
+            f"{', '.join(map(str, sorted(missing)))} не существует"
+        )
+    return objects
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(user, ingredients):
+    TIME_FORMAT = "%d/%m/%Y %H:%M"
+    yield f"Список покупок для пользователя {user.first_name}:\n\n"
+    for ing in ingredients:
+        yield f'{ing["ing_name"]}: {ing["amount"]} {ing["measure"]}\n'
+    yield f"\nДата составления {tz.now().strftime(TIME_FORMAT)}."
+
+
+def shopping_list_csv(user, ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("Ингредиент", "Количество", "Ед. измерения"))
+    for ing in ingredients:
+        yield writer.writerow((ing["ing_name"], ing["amount"], ing["measure"]))
+
+
+def shopping_list_json(user, ingredients):
+    yield "["
+    separator = ""
+    for ing in ingredients:
+        item = {
+            "name": ing["ing_name"],
+            "amount": ing["amount"],
+            "measurement_unit": ing["measure"],
+        }
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ","
+    yield "]"
+
+
+SHOPPING_LIST_FORMATS = {
+    "txt": (shopping_list_txt, "text/plain; charset=utf-8"),
+    "csv": (shopping_list_csv, "text/csv; charset=utf-8"),
+    "json": (shopping_list_json, "application/json; charset=utf-8"),
+}
@@ -1,19 +1,30 @@
 from datetime import datetime as dt
 from urllib.parse import unquote
 
-from django.http.response import HttpResponse
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404
+from django.http.response import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.cook_index import cook_index
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import ingredient_index
 from users.models import User
 
 from .filters import RecipeFilter
-from .mixins import AddDelViewMixin
+from .metrics import registry, serialization_timer
+from .mixins import (
+    AddDelViewMixin,
+    CatalogCacheMixin,
+    CursorPaginationMixin,
+)
 from .paginators import PageLimitPagination
 from .permissions import (
     AdminOrReadOnly,
@@ -21,16 +32,25 @@ from .permissions import (
     AuthorStaffOrReadOnly,
 )
 from .serializers import (
+    CookableQuerySerializer,
+    CookableRecipeSerializer,
     FollowSerializer,
     IngredientSerializer,
+    RecipeListSerializer,
     RecipeSerializer,
     ShortRecipeSerializer,
     TagSerializer,
 )
+from .utils import (
+    SHOPPING_LIST_FORMATS,
+    get_recipes_limit,
+    get_similar_limit,
+)
 
 
-class UserViewSet(DjoserUserViewSet, AddDelViewMixin):
+class UserViewSet(CursorPaginationMixin, DjoserUserViewSet, AddDelViewMixin):
     pagination_class = PageLimitPagination
+    cursor_ordering = ("username",)
     add_serializer = FollowSerializer
     permission_classes = [AuthenticatedAndNotAnonymous]
 
@@ -43,26 +63,39 @@ class UserViewSet(DjoserUserViewSet, AddDelViewMixin):
         detail=True,
     )
     def subscribe(self, request, id):
-        return self.add_remove_relation(id, "follow_M2M")
+        return self.add_remove_relation(id, "follows")
+
+    @action(methods=("POST", "DELETE"), detail=False, url_path="subscribe")
+    def subscribe_many(self, request):
+        return self.add_remove_relations("follows")
 
     @action(methods=("get",), detail=False)
     def subscriptions(self, request):
         user = self.request.user
         authors = user.follow.all()
         pages = self.paginate_queryset(authors)
+
+        recipes = Recipe.objects.order_by("-pub_date", "-id")
+        limit = get_recipes_limit(request)
+        if limit is not None:
+            recipes = recipes.latest_per_author(pages, limit)
+        prefetch_related_objects(
+            pages, Prefetch("recipes", recipes, to_attr="recent_recipes")
+        )
+
         serializer = FollowSerializer(
             pages, many=True, context={"request": request}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AdminOrReadOnly,)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AdminOrReadOnly,)
@@ -73,17 +106,21 @@ class IngredientViewSet(ReadOnlyModelViewSet):
         if name:
             if name[0] == "%":
                 name = unquote(name)
-            name = name.lower()
-            stw_queryset = list(queryset.filter(name__startswith=name))
-            cnt_queryset = queryset.filter(name__contains=name)
-            stw_queryset.extend(
-                [i for i in cnt_queryset if i not in stw_queryset]
-            )
-            queryset = stw_queryset
+            if settings.INGREDIENT_INDEX_ENABLED:
+                return ingredient_index.search(
+                    name, settings.INGREDIENT_SEARCH_LIMIT
+                )
+            queryset = queryset.search(name.lower())[
+                : settings.INGREDIENT_SEARCH_LIMIT
+            ]
         return queryset
 
+    @action(methods=("get",), detail=False, permission_classes=(IsAdminUser,))
+    def search_stats(self, request):
+        return Response(ingredient_index.stats())
 
-class RecipeViewSet(ModelViewSet, AddDelViewMixin):
+
+class RecipeViewSet(CursorPaginationMixin, ModelViewSet, AddDelViewMixin):
     queryset = Recipe.objects.select_related("author")
     serializer_class = RecipeSerializer
     permission_classes = (AuthorStaffOrReadOnly,)
@@ -92,24 +129,27 @@ class RecipeViewSet(ModelViewSet, AddDelViewMixin):
     filterset_class = RecipeFilter
 
     def get_queryset(self):
+        queryset = self.queryset.annotate_user_flags(self.request.user)
+        if self.action == "list":
+            queryset = queryset.with_details()
         q_filter = RecipeFilter(
-            data=self.request.query_params, request=self.request
+            data=self.request.query_params,
+            queryset=queryset,
+            request=self.request,
         )
-        queryset = q_filter.qs
-
-        tags = self.request.query_params.getlist("tags")
-        if tags:
-            queryset = queryset.filter(tags__slug__in=tags).distinct()
+        return q_filter.qs
 
-        author = self.request.query_params.get("author")
-        if author:
-            queryset = queryset.filter(author=author)
+    def get_serializer_class(self):
+        if self.action == "list":
+            return RecipeListSerializer
+        return super().get_serializer_class()
 
-        user = self.request.user
-        if user.is_anonymous:
-            return queryset
-
-        return queryset
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        serializer = self.get_serializer()
+        with serialization_timer(request):
+            data = serializer.to_cached_representation(recipe)
+        return Response(data)
 
     @action(
         methods=(
@@ -120,7 +160,11 @@ class RecipeViewSet(ModelViewSet, AddDelViewMixin):
         detail=True,
     )
     def favorite(self, request, pk):
-        return self.add_remove_relation(pk, "is_favorite_M2M")
+        return self.add_remove_relation(pk, "favorites")
+
+    @action(methods=("POST", "DELETE"), detail=False, url_path="favorite")
+    def favorite_many(self, request):
+        return self.add_remove_relations("favorites")
 
     @action(
         methods=(
@@ -131,23 +175,77 @@ class RecipeViewSet(ModelViewSet, AddDelViewMixin):
         detail=True,
     )
     def shopping_cart(self, request, pk):
-        return self.add_remove_relation(pk, "shopping_cart_M2M")
+        return self.add_remove_relation(pk, "shopping_cart")
+
+    @action(methods=("POST", "DELETE"), detail=False, url_path="shopping_cart")
+    def shopping_cart_many(self, request):
+        return self.add_remove_relations("shopping_cart")
+
+    @action(methods=("get",), detail=True)
+    def similar(self, request, pk):
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        recipes = Recipe.objects.filter(similar_to__recipe_id=pk).order_by(
+            "-similar_to__score", "-id"
+        )[: get_similar_limit(request)]
+        if not recipes and not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(methods=("get",), detail=False)
+    def cookable(self, request):
+        params = CookableQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        found = cook_index.search(
+            params.validated_data["ingredients"],
+            params.validated_data.get("max_missing"),
+        )
+        paginator = PageLimitPagination()
+        page = paginator.paginate_queryset(found, request, view=self)
+        recipes = (
+            Recipe.objects.annotate_user_flags(request.user)
+            .with_details()
+            .in_bulk([recipe_id for recipe_id, _ in page])
+        )
+        items = []
+        for recipe_id, missing in page:
+            if recipe_id in recipes:
+                recipes[recipe_id].missing_ingredients = missing
+                items.append(recipes[recipe_id])
+        serializer = CookableRecipeSerializer(
+            items, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
 
     @action(methods=("get",), detail=False)
     def download_shopping_cart(self, request):
         user = self.request.user
-        recipe = Recipe.objects.filter(is_in_shopping_list=user).first()
-        if not recipe:
+        file_format = request.query_params.get("file_format", "txt")
+        if file_format not in SHOPPING_LIST_FORMATS:
             return Response(status=HTTP_400_BAD_REQUEST)
 
-        filename = f"{user.username}_shopping_list.txt"
-        shopping_list = recipe.create_shopping_cart(user, filename=filename)
-        if not shopping_list:
+        ingredients = Recipe.get_shopping_list(user)
+        if ingredients is None or not ingredients.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
 
-        response = HttpResponse(
-            open(filename).read(), content_type="text/plain; charset=utf-8"
+        export, content_type = SHOPPING_LIST_FORMATS[file_format]
+        filename = f"{user.username}_shopping_list.{file_format}"
+        response = StreamingHttpResponse(
+            export(user, ingredients.iterator()), content_type=content_type
         )
-        response["Content-Disposition"] = f"attachment; filename={filename}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
 
         return response
+
+
+@api_view(("get",))
+@permission_classes((IsAdminUser,))
+def metrics(request):
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4"
+    )
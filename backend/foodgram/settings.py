@@ -8,6 +8,8 @@ load_dotenv()
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_PATH = os.path.join(BASE_DIR, "data", "ingredients.csv")
+INGREDIENT_SEARCH_LIMIT = int(os.getenv("INGREDIENT_SEARCH_LIMIT", 50))
+INGREDIENT_INDEX_ENABLED = os.getenv("INGREDIENT_INDEX_ENABLED", "1") == "1"
 
 
 SECRET_KEY = os.getenv(
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.QueryMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -85,6 +88,26 @@ DATABASES = {
     }
 }
 
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv("RECIPE_CACHE_TIMEOUT", 3600))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv("AUTH_TOKEN_CACHE_TIMEOUT", 300))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -140,10 +163,38 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 6,
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.metrics.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+COOK_INDEX_MAX_INGREDIENTS = int(os.getenv("COOK_INDEX_MAX_INGREDIENTS", 100))
+COOK_INDEX_MAX_OVERLAY = int(os.getenv("COOK_INDEX_MAX_OVERLAY", 10000))
+COOK_INDEX_CHANGELOG_TIMEOUT = int(
+    os.getenv("COOK_INDEX_CHANGELOG_TIMEOUT", 24 * 3600)
+)
+COOK_INDEX_SNAPSHOT = os.getenv("COOK_INDEX_SNAPSHOT")
+COOK_INDEX_WARM = (
+    os.getenv("COOK_INDEX_WARM", "1" if COOK_INDEX_SNAPSHOT else "0") == "1"
+)
+
+SIMILAR_RECIPES_COUNT = int(os.getenv("SIMILAR_RECIPES_COUNT", 10))
+
+RELATIONS_BULK_LIMIT = int(os.getenv("RELATIONS_BULK_LIMIT", 100))
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", 20))
+# С запасом на один запрос токена при промахе кеша авторизации.
+QUERY_BUDGETS = {
+    ("api:ingredients-list", "GET"): 3,
+    ("api:recipes-list", "GET"): 5,
+    ("api:recipes-detail", "GET"): 4,
+    ("api:users-subscriptions", "GET"): 4,
 }
 
 
@@ -153,6 +204,14 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+RECIPE_IMAGE_VARIANTS = {
+    "card": (480, 480),
+    "detail": (1200, 1200),
+}
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv("RECIPE_IMAGE_MAX_SIZE", 5 * 1024**2))
+RECIPE_IMAGE_MAX_SIDE = int(os.getenv("RECIPE_IMAGE_MAX_SIDE", 6000))
+
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -1,7 +1,15 @@
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
 
 application = get_wsgi_application()
+
+if settings.COOK_INDEX_WARM:
+    from recipes.cook_index import cook_index
+
+    # Снимок индекса продуктов загружается в фоне, не задерживая старт
+    # процесса и не попадая в первый запрос к /api/recipes/cookable/.
+    cook_index.warm_in_background()
@@ -1,6 +1,9 @@
-from django.contrib.admin import ModelAdmin, TabularInline, register
+from django.contrib.admin import ModelAdmin, TabularInline, action, register
 
+from .fulltext import search_recipes
 from .models import Ingredient, IngredientInRecipe, Recipe, Tag
+from .search import ingredient_index
+from .signals import ingredients_changed
 
 EMPTY_VALUE_DISPLAY = "--None--"
 
@@ -15,6 +18,12 @@ class IngredientAdmin(ModelAdmin):
     list_display = ("name", "measurement_unit")
     search_fields = ("name",)
     list_filter = ("name",)
+    actions = ("reset_search_index",)
+
+    @action(description="Сбросить поисковый индекс ингредиентов")
+    def reset_search_index(self, request, queryset):
+        ingredient_index.invalidate()
+        self.message_user(request, "Поисковый индекс будет перестроен.")
 
 
 @register(Tag)
@@ -28,14 +37,21 @@ class RecipeAdmin(ModelAdmin):
     list_display = (
         "name",
         "author",
+        "favorites_count",
     )
     list_filter = (
         "name",
         "author__username",
     )
-    search_fields = (
-        "name",
-        "author",
-    )
+    search_fields = ("name",)
     empty_value_display = EMPTY_VALUE_DISPLAY
     inlines = (IngredientInLine,)
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_recipes(queryset, search_term), False
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        ingredients_changed.send(
+            sender=Recipe, recipe_id=form.instance.pk, ingredient_ids=None
+        )
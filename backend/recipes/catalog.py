@@ -0,0 +1,32 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = "catalog:version"
+MODIFIED_KEY = "catalog:modified"
+
+
+def _init_catalog_state():
+    now = time.time()
+    cache.add(VERSION_KEY, int(now * 1000), timeout=None)
+    cache.add(MODIFIED_KEY, now, timeout=None)
+
+
+def get_catalog_state():
+    state = cache.get_many((VERSION_KEY, MODIFIED_KEY))
+    if len(state) < 2:
+        _init_catalog_state()
+        state = cache.get_many((VERSION_KEY, MODIFIED_KEY))
+    return state[VERSION_KEY], state[MODIFIED_KEY]
+
+
+def get_catalog_version():
+    return get_catalog_state()[0]
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        _init_catalog_state()
+    cache.set(MODIFIED_KEY, time.time(), timeout=None)
@@ -0,0 +1,356 @@
+import copy
+import logging
+import os
+import threading
+import time
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import IngredientInRecipe
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "cook_index:version"
+GENERATION_KEY = "cook_index:generation"
+# Порядок выдачи: меньше недостающих ингредиентов, затем новее. Оба
+# признака упакованы в одно число, id рецепта занимает младшие ID_BITS бит.
+ID_BITS = 40
+
+
+def fetch_pairs(queryset, chunk_size=20000):
+    # Без отдельного COUNT: строки, добавленные или удалённые во время
+    # чтения, не ломают размер массива.
+    rows = queryset.iterator(chunk_size=chunk_size)
+    chunks = [np.empty((0, 2), dtype=np.int64)]
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return np.concatenate(chunks)
+        chunks.append(np.array(batch, dtype=np.int64).reshape(-1, 2))
+
+
+def change_key(generation):
+    return f"cook_index:change:{generation}"
+
+
+def _init_version():
+    cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        _init_version()
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    # Связи рецептов с ингредиентами изменились в обход журнала (удаление
+    # ингредиента, массовая загрузка): индекс перестраивается целиком.
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            _init_version()
+
+    transaction.on_commit(bump)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 0, timeout=None)
+        generation = cache.get(GENERATION_KEY, 0)
+    return generation
+
+
+def record_recipe_changes(recipe_ids):
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return
+
+    def record():
+        try:
+            generation = cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.add(GENERATION_KEY, 0, timeout=None)
+            generation = cache.incr(GENERATION_KEY)
+        cache.set(
+            change_key(generation),
+            recipe_ids,
+            settings.COOK_INDEX_CHANGELOG_TIMEOUT,
+        )
+
+    transaction.on_commit(record)
+
+
+class CookIndexState:
+    def __init__(
+        self, version, generation, recipe_ids, sizes, keys, bounds, positions
+    ):
+        self.version = int(version)
+        self.generation = int(generation)
+        self.recipe_ids = recipe_ids
+        self.sizes = sizes
+        self.keys = keys
+        self.bounds = bounds
+        self.positions = positions
+        self.postings = {
+            key: positions[bounds[index] : bounds[index + 1]]
+            for index, key in enumerate(keys.tolist())
+        }
+        self.masked = np.zeros(len(recipe_ids), dtype=bool)
+        self.overrides = {}
+
+    def to_arrays(self):
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "recipe_ids": self.recipe_ids,
+            "sizes": self.sizes,
+            "keys": self.keys,
+            "bounds": self.bounds,
+            "positions": self.positions,
+        }
+
+    def patched(self, generation, overrides):
+        state = copy.copy(self)
+        state.generation = generation
+        state.overrides = {**self.overrides, **overrides}
+        state.masked = self.masked.copy()
+        recipe_ids = np.fromiter(
+            overrides, dtype=np.int64, count=len(overrides)
+        )
+        positions = np.searchsorted(self.recipe_ids, recipe_ids)
+        found = positions < len(self.recipe_ids)
+        found[found] = self.recipe_ids[positions[found]] == recipe_ids[found]
+        state.masked[positions[found]] = True
+        return state
+
+
+class CookableRecipes:
+    def __init__(self, recipe_ids, missing):
+        self.recipe_ids = recipe_ids
+        self.missing = missing
+        self.keys = (missing.astype(np.int64) << ID_BITS) + (
+            (1 << ID_BITS) - 1 - recipe_ids
+        )
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def __getitem__(self, item):
+        stop = len(self) if item.stop is None else min(item.stop, len(self))
+        if stop < len(self):
+            top = np.argpartition(self.keys, stop - 1)[:stop]
+        else:
+            top = np.arange(len(self))
+        top = top[np.argsort(self.keys[top], kind="stable")][item]
+        return list(
+            zip(self.recipe_ids[top].tolist(), self.missing[top].tolist())
+        )
+
+
+class CookIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self.loads = 0
+        self.updates = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def build(self, version, generation):
+        links = fetch_pairs(
+            IngredientInRecipe.objects.order_by().values_list(
+                "recipe_id", "ingredients_id"
+            )
+        )
+        recipe_ids, positions = np.unique(links[:, 0], return_inverse=True)
+        sizes = np.bincount(positions, minlength=len(recipe_ids))
+        order = np.argsort(links[:, 1], kind="stable")
+        ingredients = links[order, 1]
+        positions = positions.reshape(-1)[order].astype(np.int32)
+        keys, starts = np.unique(ingredients, return_index=True)
+        return CookIndexState(
+            version,
+            generation,
+            recipe_ids,
+            sizes.astype(np.int32),
+            keys,
+            np.append(starts, len(ingredients)),
+            positions,
+        )
+
+    def save_snapshot(self, state, path=None):
+        path = path or settings.COOK_INDEX_SNAPSHOT
+        # Запись во временный файл и переименование: процессы, читающие
+        # снимок в этот момент, не увидят его наполовину записанным.
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, **state.to_arrays())
+        os.replace(temporary, path)
+
+    def load_snapshot(self, version, generation, path=None):
+        path = path or settings.COOK_INDEX_SNAPSHOT
+        if not path:
+            return None
+        try:
+            with np.load(path) as arrays:
+                state = CookIndexState(
+                    **{name: arrays[name] for name in arrays.files}
+                )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning("Снимок индекса %s повреждён", path)
+            return None
+        if state.version != version or state.generation > generation:
+            return None
+        return state
+
+    def _load_snapshot(self, version, generation):
+        state = self.load_snapshot(version, generation)
+        if state is not None and state.generation < generation:
+            state = self._apply_changes(state, generation)
+        return state
+
+    def _load(self, version, generation):
+        state = self._load_snapshot(version, generation)
+        if state is None:
+            state = self.build(version, generation)
+        self.loads += 1
+        return state
+
+    def _read_changes(self, state, generation):
+        if generation - state.generation > settings.COOK_INDEX_MAX_OVERLAY:
+            return None, None
+        generations = range(state.generation + 1, generation + 1)
+        keys = [change_key(number) for number in generations]
+        changes = cache.get_many(keys)
+        recipe_ids = set()
+        applied = state.generation
+        for number, key in zip(generations, keys):
+            if key not in changes:
+                break
+            recipe_ids.update(changes[key])
+            applied = number
+        if any(key in changes for key in keys[applied - state.generation :]):
+            # Запись в середине журнала истекла: догнать индекс уже нельзя.
+            return None, None
+        return applied, recipe_ids
+
+    def _apply_changes(self, state, generation):
+        applied, recipe_ids = self._read_changes(state, generation)
+        if applied is None:
+            return None
+        if not recipe_ids:
+            return state
+        overrides = {recipe_id: set() for recipe_id in recipe_ids}
+        links = IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("recipe_id", "ingredients_id")
+        for recipe_id, ingredient_id in links:
+            overrides[recipe_id].add(ingredient_id)
+        if (
+            len(state.overrides) + len(overrides)
+            > settings.COOK_INDEX_MAX_OVERLAY
+        ):
+            return None
+        self.updates += 1
+        return state.patched(applied, overrides)
+
+    def warm(self):
+        # Только из снимка: полное чтение связей при старте процесса
+        # не укладывается в таймаут gunicorn. Без снимка индекс
+        # загрузится при первом запросе.
+        try:
+            with self._lock:
+                if self._state is not None:
+                    return
+                state = self._load_snapshot(get_version(), get_generation())
+                if state is not None:
+                    self.loads += 1
+                    self._state = state
+        except Exception:
+            logger.exception("Не удалось загрузить снимок индекса продуктов")
+        finally:
+            connection.close()
+
+    def warm_in_background(self):
+        threading.Thread(
+            target=self.warm, name="cook-index-warm", daemon=True
+        ).start()
+
+    def _get_state(self):
+        version = get_version()
+        generation = get_generation()
+        state = self._state
+        if (
+            state is not None
+            and state.version == version
+            and state.generation == generation
+        ):
+            return state
+        with self._lock:
+            state = self._state
+            if state is not None and state.version == version:
+                if state.generation < generation:
+                    state = self._apply_changes(state, generation)
+                elif state.generation > generation:
+                    # Кеш очищен и счётчик поколений начался заново.
+                    state = None
+            else:
+                state = None
+            if state is None:
+                state = self._load(version, generation)
+            self._state = state
+            return state
+
+    def search(self, ingredient_ids, max_missing=None):
+        state = self._get_state()
+        wanted = set(ingredient_ids)
+        counts = np.zeros(len(state.recipe_ids), dtype=np.int32)
+        for ingredient_id in wanted:
+            postings = state.postings.get(ingredient_id)
+            if postings is not None:
+                counts[postings] += 1
+        counts[state.masked] = 0
+        candidates = np.flatnonzero(counts)
+        recipe_ids = state.recipe_ids[candidates]
+        missing = state.sizes[candidates] - counts[candidates]
+
+        extra = []
+        for recipe_id, ingredients in state.overrides.items():
+            matched = len(ingredients & wanted)
+            if matched:
+                extra.append((recipe_id, len(ingredients) - matched))
+        if extra:
+            extra = np.array(extra, dtype=np.int64)
+            recipe_ids = np.concatenate((recipe_ids, extra[:, 0]))
+            missing = np.concatenate((missing, extra[:, 1]))
+
+        if max_missing is not None:
+            keep = missing <= max_missing
+            recipe_ids, missing = recipe_ids[keep], missing[keep]
+        return CookableRecipes(recipe_ids, missing)
+
+    def stats(self):
+        state = self._state
+        return {
+            "recipes": len(state.recipe_ids) if state is not None else 0,
+            "overlay": len(state.overrides) if state is not None else 0,
+            "generation": state.generation if state is not None else 0,
+            "loads": self.loads,
+            "updates": self.updates,
+        }
+
+
+cook_index = CookIndex()
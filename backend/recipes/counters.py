@@ -0,0 +1,15 @@
+from users.counters import count_subquery
+
+from .models import Recipe
+
+
+def refresh_favorites_count(recipes):
+    recipes.update(
+        favorites_count=count_subquery(
+            Recipe.is_favorite.through.objects.all(), "recipe"
+        )
+    )
+
+
+def refresh_recipes_count(users):
+    users.update(recipes_count=count_subquery(Recipe.objects.all(), "author"))
@@ -0,0 +1,172 @@
+import re
+import threading
+import weakref
+
+from django.db import connection, transaction
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import IngredientInRecipe, Recipe
+
+SEARCH_TABLE = "recipes_recipe_search"
+SEARCH_CONFIG = "russian"
+# Вес совпадений в названии, ингредиентах и описании для bm25 в SQLite.
+SQLITE_WEIGHTS = "10.0, 5.0, 1.0"
+MAX_TERMS = 8
+INDEX_BATCH_SIZE = 500
+
+
+def get_terms(query):
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def get_ingredient_recipe_ids(ingredient_id):
+    return set(
+        IngredientInRecipe.objects.filter(
+            ingredients_id=ingredient_id
+        ).values_list("recipe_id", flat=True)
+    )
+
+
+def get_source_sql(count):
+    if connection.vendor == "postgresql":
+        names = "string_agg(i.name, ' ')"
+    else:
+        names = "group_concat(i.name, ' ')"
+    params = ", ".join(["%s"] * count)
+    return (
+        f"SELECT r.id, r.name, COALESCE({names}, ''), r.text "
+        "FROM recipes_recipe r "
+        "LEFT JOIN recipes_ingredientinrecipe ir ON ir.recipe_id = r.id "
+        "LEFT JOIN recipes_ingredient i ON i.id = ir.ingredients_id "
+        f"WHERE r.id IN ({params}) "
+        "GROUP BY r.id, r.name, r.text"
+    )
+
+
+def index_recipes(recipe_ids):
+    recipe_ids = sorted(set(recipe_ids))
+    if connection.vendor not in ("postgresql", "sqlite"):
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), INDEX_BATCH_SIZE):
+            batch = recipe_ids[start : start + INDEX_BATCH_SIZE]
+            source = get_source_sql(len(batch))
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE} (recipe_id, document) "
+                    "SELECT id, "
+                    "setweight(to_tsvector(%s, name), 'A') || "
+                    "setweight(to_tsvector(%s, ingredients), 'B') || "
+                    "setweight(to_tsvector(%s, text), 'C') "
+                    f"FROM ({source}) source (id, name, ingredients, text) "
+                    "ON CONFLICT (recipe_id) "
+                    "DO UPDATE SET document = EXCLUDED.document",
+                    [SEARCH_CONFIG] * 3 + batch,
+                )
+            else:
+                remove_recipes(batch)
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE} "
+                    f"(rowid, name, ingredients, text) {source}",
+                    batch,
+                )
+
+
+_pending = threading.local()
+
+
+class PendingIndex:
+    def __init__(self):
+        self.recipe_ids = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        index_recipes(self.recipe_ids)
+
+
+def schedule_index(recipe_ids):
+    # Рецепт за одну транзакцию сохраняется несколькими шагами (сам рецепт,
+    # ингредиенты), а в индекс попадает один раз — после коммита. Ссылка
+    # на отложенную задачу слабая: при откате Django выбрасывает
+    # обработчик, задача исчезает, и следующая транзакция ставит новую.
+    if not connection.in_atomic_block:
+        index_recipes(recipe_ids)
+        return
+    reference = getattr(_pending, "index", None)
+    pending = reference() if reference is not None else None
+    if pending is None or pending.done:
+        pending = PendingIndex()
+        _pending.index = weakref.ref(pending)
+        transaction.on_commit(pending)
+    pending.recipe_ids.update(recipe_ids)
+
+
+def remove_recipes(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids or connection.vendor not in ("postgresql", "sqlite"):
+        return
+    key = "recipe_id" if connection.vendor == "postgresql" else "rowid"
+    params = ", ".join(["%s"] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({params})",
+            recipe_ids,
+        )
+
+
+def rebuild_search_index(batch_size=INDEX_BATCH_SIZE):
+    if connection.vendor in ("postgresql", "sqlite"):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    last = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt=last)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not batch:
+            return
+        index_recipes(batch)
+        last = batch[-1]
+
+
+def search_recipes(queryset, query):
+    terms = get_terms(query)
+    if not terms:
+        return queryset
+
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    if connection.vendor == "postgresql":
+        key = "recipe_id"
+        condition = "document @@ to_tsquery(%s, %s)"
+        params = (SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+        rank = (
+            "SELECT ts_rank(document, to_tsquery(%s, %s)) "
+            f"FROM {SEARCH_TABLE} WHERE {key} = {table}.id"
+        )
+    elif connection.vendor == "sqlite":
+        key = "rowid"
+        condition = f"{SEARCH_TABLE} MATCH %s"
+        params = (" ".join(f'"{term}"*' for term in terms),)
+        rank = (
+            f"SELECT -bm25({SEARCH_TABLE}, {SQLITE_WEIGHTS}) "
+            f"FROM {SEARCH_TABLE} WHERE {key} = {table}.id AND {condition}"
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(text__icontains=term)
+        return queryset.filter(condition)
+
+    return (
+        queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT {key} FROM {SEARCH_TABLE} WHERE {condition}", params
+            )
+        )
+        .annotate(search_rank=RawSQL(rank, params, output_field=FloatField()))
+        .order_by("-search_rank", *Recipe._meta.ordering)
+    )
@@ -0,0 +1,115 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .payloads import invalidate_recipe_payloads
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = "recipes/variants/"
+
+_executor = None
+
+
+def encode_image(image, image_format):
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=85, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def save_variant(storage, name, image, image_format):
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, encode_image(image, image_format))
+
+
+def delete_variants(storage, variants):
+    for key, name in variants.items():
+        if key == "source":
+            continue
+        for path in (name, f"{name}.webp"):
+            if storage.exists(path):
+                storage.delete(path)
+
+
+def build_image_variants(recipe_id):
+    recipe = (
+        Recipe.objects.filter(pk=recipe_id)
+        .only("image", "image_variants")
+        .first()
+    )
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    storage = recipe.image.storage
+
+    with recipe.image.open("rb") as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+            image, image_format, ext = image.convert("RGBA"), "PNG", "png"
+        else:
+            image, image_format, ext = image.convert("RGB"), "JPEG", "jpg"
+
+        base = os.path.splitext(os.path.basename(source))[0]
+        variants = {"source": source}
+        for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+            name = save_variant(
+                storage,
+                f"{VARIANTS_DIR}{base}-{variant}.{ext}",
+                resized,
+                image_format,
+            )
+            save_variant(storage, f"{name}.webp", resized, "WEBP")
+            variants[variant] = name
+
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_variants=variants
+    )
+    if not updated:
+        delete_variants(storage, variants)
+        return
+    if recipe.image_variants.get("source") not in (None, source):
+        delete_variants(storage, recipe.image_variants)
+    invalidate_recipe_payloads([recipe_id])
+
+
+def generate_image_variants(recipe_id):
+    try:
+        build_image_variants(recipe_id)
+    except Exception:
+        logger.exception(
+            "Не удалось подготовить картинки рецепта %s", recipe_id
+        )
+
+
+def run_in_worker(recipe_id):
+    try:
+        generate_image_variants(recipe_id)
+    finally:
+        connection.close()
+
+
+def submit_image_variants(recipe_id):
+    global _executor
+    if settings.IMAGE_WORKERS <= 0:
+        generate_image_variants(recipe_id)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix="recipe-images",
+        )
+    _executor.submit(run_in_worker, recipe_id)
+
+
+def schedule_image_variants(recipe_id):
+    transaction.on_commit(lambda: submit_image_variants(recipe_id))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.cook_index import cook_index, get_generation, get_version
+
+
+class Command(BaseCommand):
+    help = "Сохранение снимка индекса подбора рецептов по продуктам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=settings.COOK_INDEX_SNAPSHOT,
+            help="Куда сохранить снимок",
+        )
+
+    def handle(self, **options):
+        if not options["path"]:
+            raise CommandError(
+                "Укажите --path или переменную COOK_INDEX_SNAPSHOT"
+            )
+        started = time.monotonic()
+        state = cook_index.build(get_version(), get_generation())
+        cook_index.save_snapshot(state, options["path"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Успешно! Рецептов в индексе: {len(state.recipe_ids)} "
+                f"({time.monotonic() - started:.1f} с)"
+            )
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Подготовка уменьшенных копий и WebP для картинок рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересоздать копии, даже если они уже есть",
+        )
+
+    def handle(self, **options):
+        recipes = Recipe.objects.exclude(image="").only(
+            "image", "image_variants"
+        )
+        built = 0
+        for recipe in recipes.iterator():
+            source = recipe.image_variants.get("source")
+            if options["force"] or source != recipe.image.name:
+                build_image_variants(recipe.pk)
+                built += 1
+        self.stdout.write(self.style.SUCCESS(f"Успешно! Обработано: {built}"))
@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.similarity import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = "Расчёт похожих рецептов по ингредиентам и тегам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=settings.SIMILAR_RECIPES_COUNT,
+            help="Сколько похожих рецептов хранить для каждого",
+        )
+        parser.add_argument(
+            "--tag-weight",
+            type=float,
+            default=0.3,
+            help="Доля тегов в оценке сходства, от 0 до 1",
+        )
+        parser.add_argument(
+            "--max-frequency",
+            type=float,
+            default=0.2,
+            help=(
+                "Не учитывать ингредиенты, которые встречаются в большей "
+                "доле рецептов"
+            ),
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=2_000_000,
+            help="Сколько пар рецептов сравнивать за один шаг",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Размер пачки при записи в базу",
+        )
+
+    @transaction.atomic
+    def handle(self, **options):
+        started = time.monotonic()
+        total = rebuild_similar_recipes(
+            options["top"],
+            options["tag_weight"],
+            options["max_frequency"],
+            options["budget"],
+            options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Успешно! Сохранено пар: {total} "
+                f"({time.monotonic() - started:.1f} с)"
+            )
+        )
@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from recipes.transfer import MODELS, export_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгрузка пользователей, тегов, ингредиентов и рецептов "
+        "в формате JSON Lines"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл для выгрузки")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Количество объектов в одном запросе",
+        )
+
+    def handle(self, **options):
+        start = time.monotonic()
+        total = 0
+        with open(options["path"], "w", encoding="UTF-8") as file:
+            for model in MODELS:
+                count = 0
+                for record in export_records(model, options["batch_size"]):
+                    file.write(
+                        json.dumps(
+                            record, cls=DjangoJSONEncoder, ensure_ascii=False
+                        )
+                    )
+                    file.write("\n")
+                    count += 1
+                total += count
+                self.stdout.write(f"{model._meta.label_lower}: {count}")
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Успешно! Выгружено объектов: {total}, "
+                f"время: {elapsed:.1f} с"
+            )
+        )
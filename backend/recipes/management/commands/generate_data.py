@@ -0,0 +1,213 @@
+import random
+import time
+from datetime import timedelta
+from io import StringIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.transfer import keep_auto_dates, rebuild_derived_data
+from users.models import User
+
+TAGS = (
+    ("Завтрак", "breakfast", "#E26C2D"),
+    ("Обед", "lunch", "#49B64E"),
+    ("Ужин", "dinner", "#8775D2"),
+)
+DISHES = ("Салат", "Суп", "Запеканка", "Пирог", "Рагу", "Паста", "Каша")
+
+
+def insert(model, objects, batch_size):
+    total = 0
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return total
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+
+
+def popularity(rng, size):
+    return list(accumulate(rng.paretovariate(1.2) for _ in range(size)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерация тестовых пользователей, рецептов, подписок, "
+        "избранного и списков покупок"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument(
+            "--follows",
+            type=int,
+            default=10,
+            help="Среднее число подписок пользователя",
+        )
+        parser.add_argument(
+            "--favorites",
+            type=int,
+            default=20,
+            help="Среднее число рецептов в избранном",
+        )
+        parser.add_argument(
+            "--cart",
+            type=int,
+            default=5,
+            help="Среднее число рецептов в списке покупок",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--password",
+            default="foodgram-benchmark",
+            help="Пароль всех созданных пользователей",
+        )
+
+    def handle(self, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.started = time.monotonic()
+
+        call_command("load_ingredients", stdout=StringIO())
+        self.ingredients = list(Ingredient.objects.values_list("id", "name"))
+        self.tags = [
+            Tag.objects.get_or_create(
+                slug=slug, defaults={"name": name, "color": color}
+            )[0].pk
+            for name, slug, color in TAGS
+        ]
+
+        with transaction.atomic():
+            users = self.create_users(options["users"], options["password"])
+            authors = popularity(self.rng, len(users))
+            recipes = self.create_recipes(options["recipes"], users, authors)
+            self.create_follows(users, authors, options["follows"])
+            weights = popularity(self.rng, len(recipes))
+            for stage, through, average in (
+                (
+                    "Избранное",
+                    Recipe.is_favorite.through,
+                    options["favorites"],
+                ),
+                (
+                    "Списки покупок",
+                    Recipe.is_in_shopping_list.through,
+                    options["cart"],
+                ),
+            ):
+                rows = self.choose_recipes(
+                    through, users, recipes, weights, average
+                )
+                self.report(stage, insert(through, rows, self.batch_size))
+            rebuild_derived_data(self.batch_size)
+            self.report("Пересчёт счётчиков, списков покупок и поиска")
+
+        self.stdout.write(self.style.SUCCESS("Успешно!"))
+
+    def report(self, stage, count=None):
+        elapsed = time.monotonic() - self.started
+        if count is not None:
+            stage = f"{stage}: {count}"
+        self.stdout.write(f"{stage} ({elapsed:.1f} с)")
+
+    def create_users(self, count, password):
+        start = User.objects.aggregate(last=Max("pk"))["last"] or 0
+        password = make_password(password)
+        users = (
+            User(
+                username=f"user{number}",
+                email=f"user{number}@example.com",
+                first_name=f"Имя{number}",
+                last_name=f"Фамилия{number}",
+                password=password,
+            )
+            for number in range(start + 1, start + count + 1)
+        )
+        self.report("Пользователи", insert(User, users, self.batch_size))
+        return list(
+            User.objects.filter(pk__gt=start).values_list("pk", flat=True)
+        )
+
+    def create_recipes(self, count, users, authors):
+        rng = self.rng
+        start = Recipe.objects.aggregate(last=Max("pk"))["last"] or 0
+        now = timezone.now()
+        recipes = (
+            Recipe(
+                author_id=author,
+                name=(
+                    f"{rng.choice(DISHES)}: "
+                    f"{rng.choice(self.ingredients)[1]}"
+                )[:200],
+                text=", ".join(
+                    name for _, name in rng.sample(self.ingredients, 8)
+                ),
+                cooking_time=rng.randint(5, 180),
+                pub_date=now - timedelta(seconds=rng.randint(0, 365 * 86400)),
+            )
+            for author in rng.choices(users, cum_weights=authors, k=count)
+        )
+        with keep_auto_dates(Recipe):
+            self.report("Рецепты", insert(Recipe, recipes, self.batch_size))
+        recipe_ids = list(
+            Recipe.objects.filter(pk__gt=start).values_list("pk", flat=True)
+        )
+
+        ingredient_ids = [pk for pk, _ in self.ingredients]
+        links = (
+            IngredientInRecipe(
+                recipe_id=recipe,
+                ingredients_id=ingredient,
+                amount=rng.randint(1, 500),
+            )
+            for recipe in recipe_ids
+            for ingredient in rng.sample(ingredient_ids, rng.randint(3, 12))
+        )
+        self.report(
+            "Ингредиенты в рецептах",
+            insert(IngredientInRecipe, links, self.batch_size),
+        )
+        through = Recipe.tags.through
+        tags = (
+            through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipe_ids
+            for tag in rng.sample(self.tags, rng.randint(1, 2))
+        )
+        self.report("Теги рецептов", insert(through, tags, self.batch_size))
+        return recipe_ids
+
+    def create_follows(self, users, authors, average):
+        rng = self.rng
+        through = User.follow.through
+        follows = (
+            through(from_user_id=user, to_user_id=author)
+            for user in users
+            for author in set(
+                rng.choices(
+                    users, cum_weights=authors, k=rng.randint(0, 2 * average)
+                )
+            )
+            if author != user
+        )
+        self.report("Подписки", insert(through, follows, self.batch_size))
+
+    def choose_recipes(self, through, users, recipes, weights, average):
+        rng = self.rng
+        return (
+            through(user_id=user, recipe_id=recipe)
+            for user in users
+            for recipe in set(
+                rng.choices(
+                    recipes, cum_weights=weights, k=rng.randint(0, 2 * average)
+                )
+            )
+        )
@@ -0,0 +1,69 @@
+import os
+import time
+from tempfile import TemporaryFile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.streaming import StreamError, iter_json_array, iter_json_lines
+from recipes.transfer import ImportConflict, Importer, rebuild_derived_data
+
+READERS = {"json": iter_json_array, "jsonl": iter_json_lines}
+
+
+class Command(BaseCommand):
+    help = (
+        "Загрузка пользователей, тегов, ингредиентов и рецептов "
+        "из JSON Lines или JSON-фикстуры"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл с данными")
+        parser.add_argument(
+            "--format",
+            choices=tuple(READERS),
+            help="Формат файла, по умолчанию определяется по расширению",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Количество строк в одной вставке",
+        )
+
+    def handle(self, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1][1:]
+        if file_format not in READERS:
+            raise CommandError(f"Неизвестный формат файла: {path}")
+
+        start = time.monotonic()
+        with open(path, "r", encoding="UTF-8") as file, TemporaryFile(
+            "w+", encoding="UTF-8"
+        ) as m2m_file, transaction.atomic():
+            importer = Importer(m2m_file, options["batch_size"])
+            try:
+                for number, record in enumerate(READERS[file_format](file), 1):
+                    importer.add(record)
+                    if number % options["batch_size"] == 0:
+                        elapsed = time.monotonic() - start
+                        self.stdout.write(
+                            f"Прочитано записей: {number} "
+                            f"({number / elapsed:.0f}/с)",
+                            ending="\r",
+                        )
+                self.stdout.write("")
+                self.stdout.write("Запись связей и пересчёт счётчиков...")
+                importer.finish()
+            except (StreamError, ImportConflict) as error:
+                raise CommandError(error)
+            rebuild_derived_data(options["batch_size"])
+
+        for label, count in sorted(importer.counts.items()):
+            self.stdout.write(f"{label}: {count}")
+        for label, count in sorted(importer.skipped.items()):
+            self.stdout.write(f"{label}: пропущено {count}")
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            self.style.SUCCESS(f"Успешно! Время: {elapsed:.1f} с")
+        )
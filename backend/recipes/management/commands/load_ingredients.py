@@ -1,21 +1,124 @@
 import csv
+import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from recipes.catalog import bump_catalog_version
 from recipes.models import Ingredient
+from recipes.streaming import StreamError, iter_json_array, iter_json_lines
+
+FORMATS = ("csv", "json", "jsonl")
+
+
+def read_csv(file):
+    for row in csv.reader(file, delimiter=","):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_item(item):
+    try:
+        return item["name"], item["measurement_unit"]
+    except (KeyError, TypeError):
+        # Строка без нужных полей считается пропущенной.
+        return "", ""
+
+
+def read_jsonl(file):
+    for item in iter_json_lines(file):
+        yield read_item(item)
+
+
+def read_json(file):
+    for item in iter_json_array(file):
+        yield read_item(item)
+
+
+READERS = {"csv": read_csv, "json": read_json, "jsonl": read_jsonl}
 
 
 class Command(BaseCommand):
-    help = "Загрузка списка ингредиентов из CSV-файла"
-
-    def handle(self, **kwargs):
-        with open(settings.DATA_PATH, "r", encoding="UTF-8") as file:
-            reader = csv.reader(file, delimiter=",")
-
-            ingredient_list = [
-                Ingredient(name=row[0], measurement_unit=row[1])
-                for row in reader
-            ]
-        Ingredient.objects.bulk_create(ingredient_list)
-        self.stdout.write(self.style.SUCCESS("Успешно!"))
+    help = "Загрузка списка ингредиентов из CSV, JSON или JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=settings.DATA_PATH,
+            help="Путь к файлу, по умолчанию settings.DATA_PATH",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Формат файла, по умолчанию определяется по расширению",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Количество строк в одной вставке",
+        )
+
+    def handle(self, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1][1:]
+        if file_format not in FORMATS:
+            raise CommandError(f"Неизвестный формат файла: {path}")
+
+        name_length = Ingredient._meta.get_field("name").max_length
+        unit_length = Ingredient._meta.get_field("measurement_unit").max_length
+        start = time.monotonic()
+        before = Ingredient.objects.count()
+        read = skipped = 0
+
+        with open(path, "r", encoding="UTF-8") as file:
+            rows = READERS[file_format](file)
+            while True:
+                try:
+                    batch = list(islice(rows, options["batch_size"]))
+                except (StreamError, UnicodeDecodeError) as error:
+                    raise CommandError(error)
+                if not batch:
+                    break
+                read += len(batch)
+                ingredients = []
+                for name, unit in batch:
+                    if not isinstance(name, str) or not isinstance(unit, str):
+                        skipped += 1
+                        continue
+                    name, unit = name.strip(), unit.strip()
+                    if (
+                        not name
+                        or not unit
+                        or len(name) > name_length
+                        or len(unit) > unit_length
+                    ):
+                        skipped += 1
+                        continue
+                    ingredients.append(
+                        Ingredient(name=name, measurement_unit=unit)
+                    )
+                Ingredient.objects.bulk_create(
+                    ingredients, ignore_conflicts=True
+                )
+                elapsed = time.monotonic() - start
+                self.stdout.write(
+                    f"Обработано строк: {read} ({read / elapsed:.0f}/с)",
+                    ending="\r",
+                )
+
+        created = Ingredient.objects.count() - before
+        if created:
+            bump_catalog_version()
+        elapsed = time.monotonic() - start
+        self.stdout.write("")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Успешно! Прочитано: {read}, добавлено: {created}, "
+                f"уже были: {read - skipped - created}, "
+                f"пропущено: {skipped}, время: {elapsed:.1f} с"
+            )
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import refresh_favorites_count, refresh_recipes_count
+from recipes.models import Recipe
+from users.counters import refresh_followers_count
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Пересчёт счётчиков избранного, рецептов и подписчиков"
+
+    @transaction.atomic
+    def handle(self, **kwargs):
+        refresh_favorites_count(Recipe.objects.all())
+        refresh_recipes_count(User.objects.all())
+        refresh_followers_count(User.objects.all())
+        self.stdout.write(self.style.SUCCESS("Успешно!"))
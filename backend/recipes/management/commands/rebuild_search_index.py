@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.fulltext import INDEX_BATCH_SIZE, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Перестроение полнотекстового индекса рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=INDEX_BATCH_SIZE,
+            help="Сколько рецептов индексировать за один запрос",
+        )
+
+    @transaction.atomic
+    def handle(self, **options):
+        rebuild_search_index(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Успешно!"))
@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for group in duplicates:
+        keep_id = group['keep_id']
+        extra_ids = list(
+            Ingredient.objects.filter(
+                name=group['name'],
+                measurement_unit=group['measurement_unit'],
+            )
+            .exclude(id=keep_id)
+            .values_list('id', flat=True)
+        )
+        for model, field, owner in (
+            (IngredientInRecipe, 'ingredients', 'recipe'),
+            (ShoppingListItem, 'ingredient', 'user'),
+        ):
+            rows = model.objects.filter(**{f'{field}__in': extra_ids})
+            for row in rows:
+                kept = model.objects.filter(
+                    **{field: keep_id, owner: getattr(row, f'{owner}_id')}
+                )
+                if kept.update(amount=F('amount') + row.amount):
+                    row.delete()
+                else:
+                    setattr(row, f'{field}_id', keep_id)
+                    row.save(update_fields=[field])
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
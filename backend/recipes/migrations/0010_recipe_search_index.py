@@ -0,0 +1,60 @@
+from django.db import migrations
+
+TABLE_NAME = 'recipes_recipe_search'
+INDEX_NAME = 'recipes_recipe_search_document'
+
+SOURCE_SQL = (
+    'SELECT r.id, r.name, COALESCE({names}, \'\'), r.text '
+    'FROM recipes_recipe r '
+    'LEFT JOIN recipes_ingredientinrecipe ir ON ir.recipe_id = r.id '
+    'LEFT JOIN recipes_ingredient i ON i.id = ir.ingredients_id '
+    'GROUP BY r.id, r.name, r.text'
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {TABLE_NAME} ('
+            'recipe_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+            f'ON {TABLE_NAME} USING gin (document)'
+        )
+        source = SOURCE_SQL.format(names="string_agg(i.name, ' ')")
+        schema_editor.execute(
+            f'INSERT INTO {TABLE_NAME} (recipe_id, document) '
+            'SELECT id, '
+            'setweight(to_tsvector(\'russian\', name), \'A\') || '
+            'setweight(to_tsvector(\'russian\', ingredients), \'B\') || '
+            'setweight(to_tsvector(\'russian\', text), \'C\') '
+            f'FROM ({source}) source (id, name, ingredients, text)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_NAME} '
+            'USING fts5(name, ingredients, text)'
+        )
+        source = SOURCE_SQL.format(names="group_concat(i.name, ' ')")
+        schema_editor.execute(
+            f'INSERT INTO {TABLE_NAME} (rowid, name, ingredients, text) '
+            f'{source}'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
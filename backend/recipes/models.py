@@ -1,9 +1,21 @@
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import F, Sum, UniqueConstraint
-from django.http import HttpResponse
-from django.utils import timezone as tz
+from django.db.models import (
+    BooleanField,
+    Case,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    UniqueConstraint,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
 from users.models import User
 
@@ -34,6 +46,21 @@ class Tag(models.Model):
         return f"{self.name} {self.color}"
 
 
+class IngredientQuerySet(models.QuerySet):
+    def search(self, name):
+        return (
+            self.filter(name__contains=name)
+            .annotate(
+                rank=Case(
+                    When(name__startswith=name, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by("rank", "name")
+        )
+
+
 class Ingredient(models.Model):
     name = models.CharField(
         "Название ингредиента",
@@ -42,14 +69,88 @@ class Ingredient(models.Model):
     )
     measurement_unit = models.CharField("Ед. измерения", max_length=10)
 
+    objects = IngredientQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            UniqueConstraint(
+                fields=["name", "measurement_unit"],
+                name="unique_ingredient_name_unit",
+            )
+        ]
 
     def __str__(self):
         return f"{self.name}, {self.measurement_unit}"
 
 
+def detail_prefetches():
+    return (
+        "tags",
+        Prefetch(
+            "ingredient",
+            queryset=IngredientInRecipe.objects.select_related("ingredients"),
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_details(self):
+        return self.select_related("author").prefetch_related(
+            *detail_prefetches()
+        )
+
+    def latest_per_author(self, authors, limit):
+        if not authors:
+            # Условие author__in=[] не компилируется в SQL вручную.
+            return self.none()
+        ranked = (
+            Recipe.objects.filter(author__in=authors)
+            .annotate(
+                recipe_rank=Window(
+                    RowNumber(),
+                    partition_by=F("author"),
+                    order_by=(F("pub_date").desc(), F("id").desc()),
+                )
+            )
+            .values("id", "recipe_rank")
+        )
+        sql, params = ranked.query.get_compiler(self.db).as_sql()
+        return self.filter(
+            pk__in=RawSQL(
+                f"SELECT id FROM ({sql}) ranked WHERE recipe_rank <= %s",
+                (*params, limit),
+            )
+        )
+
+    def annotate_user_flags(self, user):
+        if user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false,
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Recipe.is_favorite.through.objects.filter(
+                    recipe=OuterRef("pk"), user=user
+                )
+            ),
+            is_in_shopping_cart=Exists(
+                Recipe.is_in_shopping_list.through.objects.filter(
+                    recipe=OuterRef("pk"), user=user
+                )
+            ),
+            author_is_subscribed=Exists(
+                User.follow.through.objects.filter(
+                    from_user=user, to_user=OuterRef("author")
+                )
+            ),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -69,6 +170,9 @@ class Recipe(models.Model):
     image = models.ImageField(
         "Картинка", upload_to="recipes/images/", blank=True
     )
+    image_variants = models.JSONField(
+        "Уменьшенные копии картинки", default=dict, blank=True, editable=False
+    )
     cooking_time = models.PositiveSmallIntegerField(
         "Время приготовление (мин.)",
         default=1,
@@ -86,50 +190,46 @@ class Recipe(models.Model):
     is_in_shopping_list = models.ManyToManyField(
         User, verbose_name="Список покупок", related_name="shopping_list"
     )
+    favorites_count = models.PositiveIntegerField(
+        "В избранном", default=0, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        ordering = ("-pub_date", "-id")
+        indexes = [
+            models.Index(
+                fields=("author", "-pub_date"), name="recipe_author_pub_date"
+            ),
+            models.Index(fields=("-pub_date", "-id"), name="recipe_pub_date"),
+        ]
+
+    def get_image_url(self, variant=None):
+        if not self.image:
+            return None
+        name = self.image_variants.get(variant)
+        if name and self.image_variants.get("source") == self.image.name:
+            return self.image.storage.url(name)
+        return self.image.url
 
-    def get_shopping_list(self, user):
+    @staticmethod
+    def get_shopping_list(user):
         if not user.is_authenticated:
             return None
         ingredients = (
-            IngredientInRecipe.objects.filter(recipe__is_in_shopping_list=user)
+            ShoppingListItem.objects.filter(user=user)
             .values(
-                ing_name=F("ingredients__name"),
-                measure=F("ingredients__measurement_unit"),
+                "amount",
+                ing_name=F("ingredient__name"),
+                measure=F("ingredient__measurement_unit"),
             )
-            .annotate(amount=Sum("amount"))
-            .order_by("ingredients__name")
+            .order_by("ingredient__name")
         )
         return ingredients
 
-    def create_shopping_cart(self, user, filename=None):
-        TIME_FORMAT = "%d/%m/%Y %H:%M"
-        ingredients = self.get_shopping_list(user)
-
-        if not ingredients:
-            return None
-
-        shopping_list = (
-            f"Список покупок для пользователя {user.first_name}:\n\n"
-        )
-        for ing in ingredients:
-            shopping_list += (
-                f'{ing["ing_name"]}: {ing["amount"]} {ing["measure"]}\n'
-            )
-
-        shopping_list += (
-            f"\nДата составления {tz.now().strftime(TIME_FORMAT)}."
-        )
-
-        if filename:
-            with open(filename, "w") as f:
-                f.write(shopping_list)
-
-        return shopping_list
-
     def __str__(self):
         return f"{self.name}"
 
@@ -156,3 +256,56 @@ class IngredientInRecipe(models.Model):
                 name="unique_ingredient_recipe",
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+    )
+    amount = models.PositiveIntegerField("Количество")
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Списки покупок"
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_user_shopping_list_ingredient",
+            )
+        ]
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_recipes",
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+    )
+    score = models.FloatField("Сходство")
+
+    class Meta:
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        indexes = [
+            models.Index(
+                fields=("recipe", "-score"), name="similar_recipe_score"
+            ),
+        ]
+        constraints = [
+            UniqueConstraint(
+                fields=["recipe", "similar"],
+                name="unique_similar_recipe",
+            )
+        ]
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .catalog import get_catalog_version
+
+
+def recipe_payload_key(recipe_id, version):
+    return f"recipe:{recipe_id}:{version}"
+
+
+def get_recipe_payload(recipe_id, build):
+    key = recipe_payload_key(recipe_id, get_catalog_version())
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, settings.RECIPE_CACHE_TIMEOUT)
+    return payload
+
+
+def invalidate_recipe_payloads(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+
+    def delete():
+        version = get_catalog_version()
+        cache.delete_many(
+            [recipe_payload_key(pk, version) for pk in recipe_ids]
+        )
+
+    transaction.on_commit(delete)
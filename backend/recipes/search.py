@@ -0,0 +1,74 @@
+import threading
+from bisect import bisect_left
+
+from .catalog import get_catalog_version
+from .models import Ingredient
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._items = None
+            self.invalidations += 1
+
+    def _load(self):
+        items = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (
+                ingredient.name.lower(),
+                ingredient.name,
+                ingredient.id,
+            ),
+        )
+        return [ingredient.name.lower() for ingredient in items], items
+
+    def _get_entries(self):
+        version = get_catalog_version()
+        keys, items = self._keys, self._items
+        if keys is not None and self._version == version:
+            self.hits += 1
+            return keys, items
+        with self._lock:
+            self.misses += 1
+            if self._keys is None or self._version != version:
+                self._keys, self._items = self._load()
+                self._version = version
+            return self._keys, self._items
+
+    def search(self, name, limit):
+        keys, items = self._get_entries()
+        name = name.lower()
+        start = bisect_left(keys, name)
+        end = bisect_left(keys, name + "\U0010ffff", start)
+
+        result = items[start : min(end, start + limit)]
+        if len(result) < limit:
+            for position, key in enumerate(keys):
+                if start <= position < end or name not in key:
+                    continue
+                result.append(items[position])
+                if len(result) == limit:
+                    break
+        return result
+
+    def stats(self):
+        return {
+            "size": len(self._keys) if self._keys is not None else 0,
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,84 @@
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from users.models import User
+
+from .models import IngredientInRecipe, Recipe, ShoppingListItem
+
+
+@transaction.atomic
+def refresh_shopping_lists(user_ids, ingredient_ids=None):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    list(User.objects.select_for_update().filter(pk__in=user_ids))
+
+    items = ShoppingListItem.objects.filter(user__in=user_ids)
+    source = IngredientInRecipe.objects.filter(
+        recipe__is_in_shopping_list__in=user_ids
+    )
+    if ingredient_ids is not None:
+        items = items.filter(ingredient__in=ingredient_ids)
+        source = source.filter(ingredients__in=ingredient_ids)
+
+    totals = source.values(
+        cart_user=F("recipe__is_in_shopping_list"),
+        cart_ingredient=F("ingredients"),
+    ).annotate(total=Sum("amount"))
+
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=row["cart_user"],
+            ingredient_id=row["cart_ingredient"],
+            amount=row["total"],
+        )
+        for row in totals
+    )
+
+
+@transaction.atomic
+def rebuild_shopping_lists(batch_size=5000):
+    ShoppingListItem.objects.all().delete()
+    totals = (
+        IngredientInRecipe.objects.filter(
+            recipe__is_in_shopping_list__isnull=False
+        )
+        .values(
+            cart_user=F("recipe__is_in_shopping_list"),
+            cart_ingredient=F("ingredients"),
+        )
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+    items = (
+        ShoppingListItem(
+            user_id=row["cart_user"],
+            ingredient_id=row["cart_ingredient"],
+            amount=row["total"],
+        )
+        for row in totals.iterator()
+    )
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        ShoppingListItem.objects.bulk_create(batch)
+
+
+def get_cart_user_ids(recipe_ids):
+    return set(
+        Recipe.is_in_shopping_list.through.objects.filter(
+            recipe__in=recipe_ids
+        ).values_list("user_id", flat=True)
+    )
+
+
+def get_ingredient_ids(recipe_ids):
+    return set(
+        IngredientInRecipe.objects.filter(recipe__in=recipe_ids).values_list(
+            "ingredients_id", flat=True
+        )
+    )
@@ -0,0 +1,226 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
+
+from users.models import User
+
+from .catalog import bump_catalog_version
+from .cook_index import bump_version, record_recipe_changes
+from .counters import refresh_favorites_count, refresh_recipes_count
+from .fulltext import (
+    get_ingredient_recipe_ids,
+    remove_recipes,
+    schedule_index,
+)
+from .images import schedule_image_variants
+from .models import Ingredient, Recipe, Tag
+from .payloads import invalidate_recipe_payloads
+from .shopping_list import (
+    get_cart_user_ids,
+    get_ingredient_ids,
+    refresh_shopping_lists,
+)
+
+# Отправляется после изменения состава рецепта. ingredient_ids=None
+# означает, что мог измениться любой ингредиент рецепта.
+ingredients_changed = Signal()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def update_catalog_version(**kwargs):
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Recipe.is_favorite.through)
+def update_favorites_count(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action == "pre_clear" and reverse:
+        instance._cleared_favorites = set(
+            instance.favorites.values_list("id", flat=True)
+        )
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif action == "post_clear":
+        recipes = Recipe.objects.filter(pk__in=instance._cleared_favorites)
+    else:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    refresh_favorites_count(recipes)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_author(sender, instance, raw, update_fields, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and "author" not in update_fields:
+        return
+    instance._old_author_id = (
+        Recipe.objects.filter(pk=instance.pk)
+        .values_list("author_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipes_count_on_save(sender, instance, created, raw, **kwargs):
+    # Фикстуры loaddata сохраняются как есть: счётчики после них
+    # пересчитывает rebuild_counters, как и после import_data.
+    if raw:
+        return
+    old_author_id = vars(instance).pop("_old_author_id", instance.author_id)
+    if created or old_author_id != instance.author_id:
+        refresh_recipes_count(
+            User.objects.filter(pk__in={old_author_id, instance.author_id})
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def update_recipes_count_on_delete(sender, instance, **kwargs):
+    refresh_recipes_count(User.objects.filter(pk=instance.author_id))
+
+
+@receiver(pre_delete, sender=User)
+def remember_favorited_recipes(sender, instance, **kwargs):
+    instance._favorited_recipes = set(
+        instance.favorites.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def update_favorited_recipes(sender, instance, **kwargs):
+    refresh_favorites_count(
+        Recipe.objects.filter(pk__in=instance._favorited_recipes)
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.is_in_shopping_list.through)
+def update_shopping_lists_on_cart_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action == "pre_clear" and not reverse:
+        instance._cleared_cart_users = get_cart_user_ids([instance.pk])
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse and action == "post_clear":
+        refresh_shopping_lists([instance.pk])
+    elif reverse:
+        refresh_shopping_lists([instance.pk], get_ingredient_ids(pk_set))
+    else:
+        users = (
+            instance._cleared_cart_users if action == "post_clear" else pk_set
+        )
+        refresh_shopping_lists(users, get_ingredient_ids([instance.pk]))
+
+
+@receiver(ingredients_changed, sender=Recipe)
+def update_shopping_lists_on_ingredients_change(
+    sender, recipe_id, ingredient_ids, **kwargs
+):
+    refresh_shopping_lists(get_cart_user_ids([recipe_id]), ingredient_ids)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_carts(sender, instance, **kwargs):
+    instance._cart_users = get_cart_user_ids([instance.pk])
+    instance._ingredient_ids = get_ingredient_ids([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def update_shopping_lists_on_delete(sender, instance, **kwargs):
+    refresh_shopping_lists(instance._cart_users, instance._ingredient_ids)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_payload(sender, instance, **kwargs):
+    invalidate_recipe_payloads([instance.pk])
+
+
+@receiver(ingredients_changed, sender=Recipe)
+def invalidate_recipe_payload_on_ingredients_change(
+    sender, recipe_id, **kwargs
+):
+    invalidate_recipe_payloads([recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_payload_on_tags_change(
+    sender, instance, action, reverse, **kwargs
+):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        bump_catalog_version()
+    else:
+        invalidate_recipe_payloads([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipe_payloads(
+    sender, instance, created, update_fields, **kwargs
+):
+    if created or update_fields and set(update_fields) <= {"last_login"}:
+        return
+    invalidate_recipe_payloads(instance.recipes.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_variants(sender, instance, **kwargs):
+    source = instance.image_variants.get("source")
+    if instance.image and source != instance.image.name:
+        schedule_image_variants(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_index(sender, instance, update_fields, **kwargs):
+    if update_fields and not {"name", "text"} & set(update_fields):
+        return
+    schedule_index([instance.pk])
+
+
+@receiver(ingredients_changed, sender=Recipe)
+def update_search_index_on_ingredients_change(sender, recipe_id, **kwargs):
+    schedule_index([recipe_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_recipes([instance.pk])
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_recipes(sender, instance, **kwargs):
+    instance._recipe_ids = get_ingredient_recipe_ids(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_search_index_on_rename(sender, instance, created, **kwargs):
+    if not created:
+        schedule_index(get_ingredient_recipe_ids(instance.pk))
+
+
+@receiver(post_delete, sender=Ingredient)
+def update_search_index_on_ingredient_delete(sender, instance, **kwargs):
+    schedule_index(instance._recipe_ids)
+
+
+@receiver(ingredients_changed, sender=Recipe)
+def update_cook_index(sender, recipe_id, **kwargs):
+    record_recipe_changes([recipe_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def update_cook_index_on_delete(sender, instance, **kwargs):
+    record_recipe_changes([instance.pk])
+
+
+@receiver(post_delete, sender=Ingredient)
+def update_cook_index_on_ingredient_delete(sender, instance, **kwargs):
+    bump_version()
@@ -0,0 +1,143 @@
+from itertools import chain, islice
+
+import numpy as np
+from django.db import connection
+from scipy import sparse
+
+from .cook_index import fetch_pairs
+from .models import IngredientInRecipe, Recipe, SimilarRecipe
+
+
+def normalize_rows(matrix):
+    if sparse.issparse(matrix):
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ matrix
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1
+    return matrix / norms[:, None]
+
+
+def build_vectors(max_frequency):
+    links = fetch_pairs(
+        IngredientInRecipe.objects.order_by().values_list(
+            "recipe_id", "ingredients_id"
+        )
+    )
+    recipe_ids, rows = np.unique(links[:, 0], return_inverse=True)
+    _, columns = np.unique(links[:, 1], return_inverse=True)
+    rows, columns = rows.reshape(-1), columns.reshape(-1)
+    size = len(recipe_ids)
+    frequency = np.bincount(columns)
+    # Соль и вода есть почти везде: сходства они не добавляют, а пар
+    # кандидатов дают больше всего, поэтому в расчёт не берутся.
+    common = frequency[columns] > max_frequency * size
+    rows, columns = rows[~common], columns[~common]
+    # Редкие ингредиенты важнее для сходства, чем распространённые.
+    weights = np.log((1 + size) / (1 + frequency)) + 1
+    ingredients = sparse.csr_matrix(
+        (weights[columns].astype(np.float32), (rows, columns)),
+        shape=(size, len(frequency)),
+    )
+    # Сколько пар кандидатов даст строка при умножении на матрицу.
+    costs = (
+        sparse.csr_matrix(
+            (frequency[columns], (rows, columns)), shape=ingredients.shape
+        )
+        .sum(axis=1)
+        .A1
+    )
+
+    tags = fetch_pairs(
+        Recipe.tags.through.objects.order_by().values_list(
+            "recipe_id", "tag_id"
+        )
+    )
+    positions = np.searchsorted(recipe_ids, tags[:, 0])
+    known = positions < size
+    known[known] = recipe_ids[positions[known]] == tags[known, 0]
+    _, tag_columns = np.unique(tags[known, 1], return_inverse=True)
+    tag_matrix = np.zeros(
+        (size, tag_columns.max() + 1 if len(tag_columns) else 0), dtype=bool
+    )
+    tag_matrix[positions[known], tag_columns.reshape(-1)] = True
+    # Наборов тегов немного, поэтому их сходство считается заранее
+    # для каждой пары наборов, а не для каждой пары рецептов.
+    tag_sets, tag_set_ids = np.unique(tag_matrix, axis=0, return_inverse=True)
+    tag_sets = normalize_rows(tag_sets.astype(np.float32))
+
+    return (
+        recipe_ids,
+        normalize_rows(ingredients).tocsr(),
+        tag_set_ids.reshape(-1),
+        tag_sets @ tag_sets.T,
+        costs,
+    )
+
+
+def iter_chunks(costs, budget):
+    start = 0
+    total = np.cumsum(costs)
+    while start < len(costs):
+        offset = total[start - 1] if start else 0
+        stop = np.searchsorted(total, offset + budget, side="right")
+        stop = max(stop, start + 1)
+        yield start, stop
+        start = stop
+
+
+def iter_similar(top, tag_weight, max_frequency, budget):
+    recipe_ids, ingredients, tag_sets, tag_similarity, costs = build_vectors(
+        max_frequency
+    )
+    transposed = ingredients.T.tocsr()
+    for start, stop in iter_chunks(costs, budget):
+        block = (ingredients[start:stop] @ transposed).tocsr()
+        rows = np.repeat(np.arange(start, stop), np.diff(block.indptr))
+        columns = block.indices
+        scores = (1 - tag_weight) * block.data + tag_weight * tag_similarity[
+            tag_sets[rows], tag_sets[columns]
+        ]
+        keep = (scores > 0) & (rows != columns)
+        rows, columns, scores = rows[keep], columns[keep], scores[keep]
+
+        # Строки блока по порядку, внутри строки — по убыванию сходства.
+        order = np.argsort(rows - start + (1 - np.clip(scores, 0, 1)) / 2)
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        counts = np.bincount(rows - start, minlength=stop - start)
+        firsts = np.cumsum(counts) - counts
+        best = np.arange(len(rows)) - firsts[rows - start] < top
+        yield (
+            recipe_ids[rows[best]],
+            recipe_ids[columns[best]],
+            scores[best].round(6),
+        )
+
+
+def insert_similar(recipe_ids, similar_ids, scores, batch_size):
+    table = connection.ops.quote_name(SimilarRecipe._meta.db_table)
+    rows = zip(recipe_ids.tolist(), similar_ids.tolist(), scores.tolist())
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            values = ", ".join(["(%s, %s, %s)"] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} (recipe_id, similar_id, score) "
+                f"VALUES {values}",
+                list(chain.from_iterable(batch)),
+            )
+
+
+def rebuild_similar_recipes(
+    top, tag_weight, max_frequency, budget, batch_size
+):
+    SimilarRecipe.objects.all().delete()
+    total = 0
+    for recipe_ids, similar_ids, scores in iter_similar(
+        top, tag_weight, max_frequency, budget
+    ):
+        insert_similar(recipe_ids, similar_ids, scores, batch_size)
+        total += len(scores)
+    return total
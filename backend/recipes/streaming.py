@@ -0,0 +1,41 @@
+import json
+
+JSON_READ_SIZE = 64 * 1024
+
+
+class StreamError(ValueError):
+    pass
+
+
+def iter_json_lines(file):
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as error:
+            raise StreamError(f"Строка {number}: некорректный JSON: {error}")
+        yield item
+
+
+def iter_json_array(file):
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_READ_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise StreamError("JSON-файл должен содержать список объектов")
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if buffer.startswith("]", position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_READ_SIZE)
+            if not chunk:
+                raise StreamError("JSON-файл повреждён или оборван")
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
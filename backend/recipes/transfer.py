@@ -0,0 +1,220 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.utils.encoding import is_protected_type
+
+from users.counters import refresh_followers_count
+from users.models import User
+
+from .catalog import bump_catalog_version
+from .cook_index import bump_version
+from .counters import refresh_favorites_count, refresh_recipes_count
+from .fulltext import rebuild_search_index
+from .models import Ingredient, IngredientInRecipe, Recipe, Tag
+from .shopping_list import rebuild_shopping_lists
+
+MODELS = (User, Tag, Ingredient, Recipe, IngredientInRecipe)
+LABELS = {model._meta.label_lower: model for model in MODELS}
+
+
+class ImportConflict(Exception):
+    pass
+
+
+def get_m2m_fields(model):
+    return [
+        field
+        for field in model._meta.many_to_many
+        if field.related_model in MODELS
+    ]
+
+
+def get_m2m_columns(field):
+    through = field.remote_field.through._meta
+    return (
+        through.get_field(field.m2m_field_name()).attname,
+        through.get_field(field.m2m_reverse_field_name()).attname,
+    )
+
+
+def serialize_value(obj, field):
+    value = field.value_from_object(obj)
+    if field.is_relation or is_protected_type(value):
+        return value
+    return field.value_to_string(obj)
+
+
+def fetch_m2m(field, pks):
+    source, target = get_m2m_columns(field)
+    related = defaultdict(list)
+    rows = field.remote_field.through.objects.filter(
+        **{f"{source}__in": pks}
+    ).values_list(source, target)
+    for source_id, target_id in rows:
+        related[source_id].append(target_id)
+    return related
+
+
+def export_records(model, batch_size):
+    fields = [
+        field for field in model._meta.concrete_fields if not field.primary_key
+    ]
+    m2m_fields = get_m2m_fields(model)
+    queryset = model.objects.order_by("pk")
+    last_pk = None
+    while True:
+        chunk = (
+            queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        )
+        chunk = list(chunk[:batch_size])
+        if not chunk:
+            return
+        pks = [obj.pk for obj in chunk]
+        related = {field.name: fetch_m2m(field, pks) for field in m2m_fields}
+        for obj in chunk:
+            data = {
+                field.name: serialize_value(obj, field) for field in fields
+            }
+            for name, values in related.items():
+                data[name] = values.get(obj.pk, [])
+            yield {
+                "model": model._meta.label_lower,
+                "pk": obj.pk,
+                "fields": data,
+            }
+        last_pk = pks[-1]
+
+
+@contextmanager
+def keep_auto_dates(model):
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False)
+        or getattr(field, "auto_now_add", False)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def build_instance(model, record):
+    values = {}
+    for name, value in record["fields"].items():
+        field = model._meta.get_field(name)
+        if field.many_to_many:
+            continue
+        if field.is_relation:
+            values[field.attname] = value
+        else:
+            values[field.attname] = field.to_python(value)
+    return model(pk=record["pk"], **values)
+
+
+class Importer:
+    def __init__(self, m2m_file, batch_size):
+        self.m2m_file = m2m_file
+        self.batch_size = batch_size
+        self.pending = defaultdict(list)
+        self.counts = Counter()
+        self.skipped = Counter()
+        self.m2m_fields = {model: get_m2m_fields(model) for model in MODELS}
+
+    def add(self, record):
+        model = LABELS.get(record.get("model"))
+        if model is None:
+            self.skipped[record.get("model")] += 1
+            return
+        self.pending[model].append(build_instance(model, record))
+        for field in self.m2m_fields[model]:
+            for target in record["fields"].get(field.name, ()):
+                self.m2m_file.write(
+                    f"{record['model']} {field.name} {record['pk']} {target}\n"
+                )
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model):
+        objs = self.pending.pop(model, [])
+        if not objs:
+            return
+        label = model._meta.label_lower
+        # Пропущенная строка с занятым pk привязала бы связи из файла
+        # к чужой записи, поэтому конфликт прерывает загрузку.
+        existing = list(
+            model.objects.filter(pk__in=[obj.pk for obj in objs]).values_list(
+                "pk", flat=True
+            )[:10]
+        )
+        if existing:
+            raise ImportConflict(
+                f"{label}: записи с pk {', '.join(map(str, existing))} "
+                "уже есть в базе"
+            )
+        try:
+            with transaction.atomic(), keep_auto_dates(model):
+                model.objects.bulk_create(objs)
+        except IntegrityError as error:
+            raise ImportConflict(f"{label}: {error}")
+        self.counts[label] += len(objs)
+
+    def finish(self):
+        for model in MODELS:
+            self.flush(model)
+        self.write_m2m()
+        reset_sequences()
+
+    def write_m2m(self):
+        self.m2m_file.seek(0)
+        throughs = {
+            field.remote_field.through
+            for fields in self.m2m_fields.values()
+            for field in fields
+        }
+        before = {through: through.objects.count() for through in throughs}
+        pending = defaultdict(list)
+        for line in self.m2m_file:
+            label, name, source_id, target_id = line.split()
+            field = LABELS[label]._meta.get_field(name)
+            through = field.remote_field.through
+            source, target = get_m2m_columns(field)
+            pending[through].append(
+                through(**{source: int(source_id), target: int(target_id)})
+            )
+            if len(pending[through]) >= self.batch_size:
+                self.flush_m2m(through, pending.pop(through))
+        for through, rows in pending.items():
+            self.flush_m2m(through, rows)
+        # Повторы связей в файле пропускаются: считаются только
+        # действительно добавленные строки.
+        for through, count in before.items():
+            added = through.objects.count() - count
+            if added:
+                self.counts[through._meta.label_lower] = added
+
+    def flush_m2m(self, through, rows):
+        through.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def reset_sequences():
+    statements = connection.ops.sequence_reset_sql(no_style(), MODELS)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def rebuild_derived_data(batch_size):
+    refresh_favorites_count(Recipe.objects.all())
+    refresh_recipes_count(User.objects.all())
+    refresh_followers_count(User.objects.all())
+    rebuild_shopping_lists(batch_size)
+    rebuild_search_index(batch_size)
+    transaction.on_commit(bump_catalog_version)
+    bump_version()
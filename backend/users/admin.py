@@ -11,6 +11,8 @@ class UserAdmin(ModelAdmin):
         "last_name",
         "email",
         "password",
+        "recipes_count",
+        "followers_count",
     )
     fields = (
         (
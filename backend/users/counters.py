@@ -0,0 +1,25 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import User
+
+
+def count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def refresh_followers_count(users):
+    users.update(
+        followers_count=count_subquery(
+            User.follow.through.objects.all(), "to_user"
+        )
+    )
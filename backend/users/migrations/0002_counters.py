@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_followers_count(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    followers = (
+        User.follow.through.objects.filter(to_user=OuterRef('pk'))
+        .order_by()
+        .values('to_user')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    User.objects.update(followers_count=Coalesce(Subquery(followers), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(fill_followers_count, migrations.RunPython.noop),
+    ]
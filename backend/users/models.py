@@ -24,6 +24,12 @@ class User(AbstractUser):
         symmetrical=False,
         db_index=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        "Количество рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков", default=0, editable=False
+    )
 
     class Meta:
         verbose_name = "Пользователь"
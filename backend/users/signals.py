@@ -0,0 +1,38 @@
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .counters import refresh_followers_count
+from .models import User
+
+
+@receiver(m2m_changed, sender=User.follow.through)
+def update_followers_count(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action == "pre_clear" and not reverse:
+        instance._cleared_follow = set(
+            instance.follow.values_list("id", flat=True)
+        )
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        authors = User.objects.filter(pk=instance.pk)
+    elif action == "post_clear":
+        authors = User.objects.filter(pk__in=instance._cleared_follow)
+    else:
+        authors = User.objects.filter(pk__in=pk_set)
+    refresh_followers_count(authors)
+
+
+@receiver(pre_delete, sender=User)
+def remember_followed_authors(sender, instance, **kwargs):
+    instance._followed_authors = set(
+        instance.follow.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def update_followed_authors(sender, instance, **kwargs):
+    refresh_followers_count(
+        User.objects.filter(pk__in=instance._followed_authors)
+    )